@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler
+
+AUDIT_LOGGER = 'audit'
+MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file once it reaches this size
+BACKUP_COUNT = 5  # Rotated files kept as <path>.1 ... <path>.N
+BATCH_SIZE = 256  # Records written per flush at most
+FLUSH_INTERVAL = 1.0  # Seconds a record may wait before it is flushed
+QUEUE_SIZE = 100000  # Records buffered before new ones are dropped rather than blocking
+
+# Until configure_audit_log() is called, audit events reach only the root logger's handlers, if any, never stderr
+logging.getLogger(AUDIT_LOGGER).addHandler(logging.NullHandler())
+
+
+def record_to_json(record):
+    """Serialises a log record as one JSON line: time, level, logger, event and any structured fields."""
+    entry = {
+        'ts': round(record.created, 6),
+        'level': record.levelname,
+        'logger': record.name,
+        'event': record.getMessage(),
+    }
+    entry.update(getattr(record, 'audit', {}))
+    return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller; records are dropped (and counted) if the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread; only make the record safe to hand over
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AuditWriter:
+    """
+    Background thread that writes queued records to a JSON-lines file.
+
+    Records are taken off the queue in batches of up to `batch_size` and written with a
+    single write and flush, at least every `flush_interval` seconds while records are
+    pending. The file is rotated by size, keeping `backup_count` old files.
+    """
+
+    def __init__(self, path, log_queue, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.queue = log_queue
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._stop = object()
+        self._stream = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def _rollover(self):
+        self._stream.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._stream = open(self.path, 'a', encoding='utf-8')
+
+    def _write(self, lines):
+        data = '\n'.join(lines) + '\n'
+        if self.max_bytes and self._stream.tell() + len(data) > self.max_bytes and self._stream.tell() > 0:
+            self._rollover()
+        self._stream.write(data)
+        self._stream.flush()
+        self.written += len(lines)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._stop in batch:
+                stopping = True
+                # Drain whatever was queued before the stop request
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+            lines = [record_to_json(record) for record in batch if record is not self._stop]
+            if lines:
+                self._write(lines)
+        self._stream.close()
+
+    def stop(self):
+        """Writes everything still queued, then stops the thread."""
+        if self._thread.is_alive():
+            self.queue.put(self._stop)
+            self._thread.join()
+
+
+def configure_audit_log(path, logger_name=AUDIT_LOGGER, level=logging.INFO, **writer_options):
+    """
+    Routes a logger (the audit logger by default) through a non-blocking queue to a JSON-lines file.
+
+    Logging calls only put the record on a bounded queue; formatting, writing, flushing and
+    rotation all happen on a background thread, so a log call never waits on disk.
+
+    Args:
+    path (str): The log file.
+    logger_name (str): Logger to attach to. It stops propagating, so its records reach only this
+                       file and library output on the root logger stays out of it.
+    level (int): Minimum level recorded.
+    writer_options: max_bytes, backup_count, batch_size and flush_interval for AuditWriter.
+
+    Returns:
+    AuditWriter: The running writer; it is stopped (and flushed) automatically at exit.
+    """
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    writer = AuditWriter(path, log_queue, **writer_options)
+    logger = logging.getLogger(logger_name)
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    atexit.register(writer.stop)
+    return writer
+
+
+def audit_event(event, level=logging.INFO, **fields):
+    """
+    Emits a structured audit record, e.g. audit_event('challenge_issued', user='Admin 1').
+
+    Costs a level check when audit logging is not configured, and a queue put when it is.
+    """
+    logger = logging.getLogger(AUDIT_LOGGER)
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'audit': fields})
@@ -0,0 +1,365 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from collections import namedtuple
+import cv2
+import numpy as np
+from dataset import TARGET_SIZE, DEFAULT_WORKERS, CACHE_DIR_NAME, label_for, parallel_for, scan_signatures
+
+SHARD_DIR_NAME = 'shards'  # Inside the data directory's cache folder by default
+MANIFEST_NAME = 'manifest.json'
+SHARD_SIZE_MB = 64  # Upper bound on the pixel data held in one shard
+MIN_SIDE = 16  # Images smaller than this in either dimension are rejected
+PHASH_DISTANCE = -1  # Near-duplicate threshold in bits; off, as one writer's genuine signatures can be this close
+LABEL_PREFIXES = {0: 'original', 1: 'forgeries'}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+
+# One input file; label is 0 (genuine) or 1 (forged)
+Candidate = namedtuple('Candidate', ['path', 'person', 'label'])
+
+
+def difference_hash(image):
+    """64-bit perceptual hash (dHash): the sign of horizontal gradients on a 9x8 thumbnail."""
+    thumbnail = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = thumbnail[:, 1:] > thumbnail[:, :-1]
+    return int(np.packbits(bits.reshape(-1)).view('>u8')[0])
+
+
+def hamming_distances(value, hashes):
+    """Bit distance between one 64-bit hash and an array of them."""
+    return np.unpackbits((np.asarray(hashes, dtype=np.uint64) ^ np.uint64(value)).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+def collect_candidates(inputs, person=None, label=None):
+    """
+    Expands files and directories into the signatures to ingest.
+
+    The person defaults to each file's parent folder name, and the label to the file's
+    original_/forgeries_ prefix, matching the Data directory layout.
+
+    Returns:
+    list: Candidate tuples.
+    list: (path, reason) for files that were skipped.
+    """
+    file_paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                file_paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            file_paths.append(path)
+
+    candidates, skipped = [], []
+    for path in file_paths:
+        file_label = label if label is not None else label_for(os.path.basename(path))
+        if file_label is None:
+            skipped.append((path, 'no original_/forgeries_ prefix and no --label'))
+            continue
+        file_person = person or os.path.basename(os.path.dirname(os.path.abspath(path)))
+        candidates.append(Candidate(path, file_person, file_label))
+    return candidates, skipped
+
+
+def decode_candidates(candidates, target_size=TARGET_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Reads, validates, hashes and resizes every candidate in parallel.
+
+    Returns:
+    np.ndarray: uint8 grayscale images of shape (N, height, width); rows of rejected files are undefined.
+    list: Per candidate, (sha256 hex, perceptual hash) or None if the file is not a usable image.
+    """
+    width, height = target_size
+    images = np.empty((len(candidates), height, width), dtype=np.uint8)
+    hashes = [None] * len(candidates)
+
+    def work(start, stop):
+        for i in range(start, stop):
+            try:
+                with open(candidates[i].path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE) if data else None
+            if image is None or min(image.shape) < MIN_SIDE:
+                continue
+            cv2.resize(image, target_size, dst=images[i], interpolation=cv2.INTER_AREA)
+            hashes[i] = (hashlib.sha256(data).hexdigest(), difference_hash(image))
+
+    parallel_for(len(candidates), work, workers)
+    return images, hashes
+
+
+def data_tree_hashes(data_directory, sizes, phash_distance=PHASH_DISTANCE, workers=DEFAULT_WORKERS):
+    """
+    Hashes the signatures already in a data directory, so ingested files can be deduplicated against them.
+
+    Only files of one of the given sizes can be exact duplicates, so only those are read for
+    their content hash. Every file is decoded for its perceptual hash, in parallel, and only
+    when near-duplicate checks are on; the dataset cache is not used, as its resized images
+    hash differently from the originals.
+
+    Args:
+    data_directory (str): The data directory.
+    sizes (set): Byte sizes of the files being ingested.
+    phash_distance (int): Near-duplicate threshold; negative skips the perceptual hashes.
+    workers (int): Decoding threads.
+
+    Returns:
+    set: sha256 hex digests of the files that could be exact duplicates.
+    list: (person, label, perceptual hash, file path) per readable signature file.
+    """
+    if not os.path.isdir(data_directory):
+        return set(), []
+    scanned = scan_signatures(data_directory)
+    digests = set()
+    for file_path, _, stat in scanned:
+        if stat.st_size in sizes:
+            with open(file_path, 'rb') as f:
+                digests.add(hashlib.sha256(f.read()).hexdigest())
+    if phash_distance < 0:
+        return digests, []
+    phashes = [None] * len(scanned)
+
+    def work(start, stop):
+        for i in range(start, stop):
+            image = cv2.imread(scanned[i][0], cv2.IMREAD_GRAYSCALE)
+            if image is not None and min(image.shape) >= MIN_SIDE:
+                phashes[i] = difference_hash(image)
+
+    parallel_for(len(scanned), work, workers)
+    return digests, [(os.path.basename(os.path.dirname(file_path)), label, phash, file_path)
+                     for (file_path, label, _), phash in zip(scanned, phashes) if phash is not None]
+
+
+class ShardStore:
+    """
+    A directory of size-bounded .npz shards of resized grayscale signatures, described by a manifest.
+
+    Each shard holds 'images' (N, height, width) uint8, 'labels' uint8 and 'persons' strings.
+    Shards are only ever added, never rewritten, so a later ingestion appends new shards.
+    The manifest lists every shard and every stored signature with its content and
+    perceptual hashes, which is what new files are deduplicated against.
+
+    training.run_folds and incremental.fine_tune train on the shards instead of the Data
+    tree when given the store's directory (--shards). The shards hold only what was
+    ingested, so to train on an existing Data tree from shards, ingest it first.
+    """
+
+    def __init__(self, directory, target_size=TARGET_SIZE):
+        self.directory = directory
+        self.target_size = target_size
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.manifest = {'target_size': list(target_size), 'shards': [], 'entries': []}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+            if tuple(self.manifest['target_size']) != tuple(target_size):
+                raise ValueError(f"{directory} holds {self.manifest['target_size']} images, not {list(target_size)}")
+
+    def __len__(self):
+        return len(self.manifest['entries'])
+
+    def write(self, images, labels, persons, entries, shard_size_mb=SHARD_SIZE_MB):
+        """Appends images in new shards of at most `shard_size_mb` of pixels each and updates the manifest."""
+        os.makedirs(self.directory, exist_ok=True)
+        width, height = self.target_size
+        per_shard = max(1, int(shard_size_mb * 1024 * 1024) // (width * height))
+        for start in range(0, len(images), per_shard):
+            stop = min(start + per_shard, len(images))
+            name = f"shard-{len(self.manifest['shards']):05d}.npz"
+            temp_path = os.path.join(self.directory, name + '.tmp.npz')
+            np.savez(temp_path, images=images[start:stop], labels=np.asarray(labels[start:stop], dtype=np.uint8),
+                     persons=np.array(persons[start:stop], dtype=str))
+            os.replace(temp_path, os.path.join(self.directory, name))
+            self.manifest['shards'].append({'file': name, 'count': stop - start})
+            for row, entry in enumerate(entries[start:stop]):
+                self.manifest['entries'].append(dict(entry, shard=name, row=row))
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def index(self):
+        """
+        Per-signature metadata in load() order, shaped like the dataset cache's entries.
+
+        'path' is the content hash, so a model manifest names exactly the signatures it was
+        trained on; 'mtime_ns' is that of the shard holding the signature and 'size' is 0.
+        """
+        shard_mtimes = {shard['file']: os.stat(os.path.join(self.directory, shard['file'])).st_mtime_ns
+                        for shard in self.manifest['shards']}
+        return [{'path': 'sha256:' + entry['sha256'], 'mtime_ns': shard_mtimes[entry['shard']], 'size': 0,
+                 'label': entry['label']} for entry in self.manifest['entries']]
+
+    def load(self):
+        """
+        Reads every shard, in order, into one array; one sequential read per shard.
+
+        Returns:
+        np.ndarray: uint8 images (N, height, width), ready for pipeline.make_dataset.
+        np.ndarray: uint8 labels, 0 for genuine and 1 for forged.
+        np.ndarray: The person of each image.
+        """
+        width, height = self.target_size
+        total = sum(shard['count'] for shard in self.manifest['shards'])
+        images = np.empty((total, height, width), dtype=np.uint8)
+        labels = np.empty(total, dtype=np.uint8)
+        persons = []
+        offset = 0
+        for shard in self.manifest['shards']:
+            with np.load(os.path.join(self.directory, shard['file'])) as data:
+                count = len(data['labels'])
+                images[offset:offset + count] = data['images']
+                labels[offset:offset + count] = data['labels']
+                persons.extend(data['persons'].tolist())
+            offset += count
+        return images, labels, np.array(persons)
+
+
+def ingest(inputs, store, person=None, label=None, phash_distance=PHASH_DISTANCE, shard_size_mb=SHARD_SIZE_MB,
+           data_directory=None, move=False, workers=DEFAULT_WORKERS):
+    """
+    Validates, deduplicates and stores signature images.
+
+    Exact duplicates (same file bytes) are dropped against everything already stored and,
+    when placing files, already in the data directory. Near-duplicate checks are off by
+    default, since distinct signatures of one writer are often only a few bits apart; with
+    `phash_distance` set, files whose perceptual hash is that close to a stored, already
+    present or newly accepted signature of the same person and label are dropped and
+    reported with what they matched. A forgery is never discarded for resembling its
+    genuine counterpart.
+
+    Args:
+    inputs (list): Files or directories to ingest.
+    store (ShardStore): Where accepted signatures are written; None to skip the shards.
+    person (str): Person for every file; defaults to each file's folder name.
+    label (int): 0 or 1 for every file; defaults to the filename prefix.
+    phash_distance (int): Near-duplicate threshold in bits; negative disables near-duplicate checks.
+    shard_size_mb (int): Pixel data per shard.
+    data_directory (str): If given, accepted files are also placed in <data_directory>/<person>/
+                          as original_*/forgeries_* so the existing training cache picks them up;
+                          signatures already there count as duplicates. Files that cannot be
+                          placed are skipped and not stored.
+    move (bool): Move rather than copy files into data_directory.
+    workers (int): Decoding threads.
+
+    Returns:
+    dict: 'accepted' and 'placed' (paths written to data_directory) lists, counts of 'invalid',
+          'exact_duplicates', 'near_duplicates' and 'skipped', with 'skipped_files' and
+          'near_duplicate_files' ((path, matched signature) pairs).
+    """
+    candidates, skipped = collect_candidates(inputs, person, label)
+    target_size = store.target_size if store is not None else TARGET_SIZE
+    images, hashes = decode_candidates(candidates, target_size, workers)
+
+    existing = store.manifest['entries'] if store is not None else []
+    seen_sha = {entry['sha256'] for entry in existing}
+    groups = {}  # (person, label) -> (perceptual hashes, names) of the signatures kept so far
+    for entry in existing:
+        group = groups.setdefault((entry['person'], entry['label']), ([], []))
+        group[0].append(int(entry['phash'], 16))
+        group[1].append(entry['source'])
+    if data_directory:
+        sizes = {os.path.getsize(candidate.path) for candidate, hashed in zip(candidates, hashes) if hashed}
+        tree_sha, tree_phashes = data_tree_hashes(data_directory, sizes, phash_distance, workers)
+        seen_sha |= tree_sha
+        for tree_person, tree_label, phash, path in tree_phashes:
+            group = groups.setdefault((tree_person, tree_label), ([], []))
+            group[0].append(phash)
+            group[1].append(path)
+
+    stats = {'invalid': 0, 'exact_duplicates': 0, 'near_duplicates': 0, 'skipped': len(skipped)}
+    near_duplicate_files = []
+    accepted = []
+    for i, (candidate, hashed) in enumerate(zip(candidates, hashes)):
+        if hashed is None:
+            stats['invalid'] += 1
+            continue
+        sha, phash = hashed
+        if sha in seen_sha:
+            stats['exact_duplicates'] += 1
+            continue
+        group_hashes, group_names = groups.setdefault((candidate.person, candidate.label), ([], []))
+        if phash_distance >= 0 and group_hashes:
+            distances = hamming_distances(phash, group_hashes)
+            closest = int(distances.argmin())
+            if distances[closest] <= phash_distance:
+                stats['near_duplicates'] += 1
+                near_duplicate_files.append((candidate.path, group_names[closest]))
+                continue
+        seen_sha.add(sha)
+        group_hashes.append(phash)
+        group_names.append(candidate.path)
+        accepted.append(i)
+
+    # Files are placed before anything is recorded, so the manifest never lists a signature
+    # that did not reach the data directory and would wrongly block it as a duplicate later
+    placed = []
+    if data_directory:
+        kept = []
+        for i in accepted:
+            candidate = candidates[i]
+            person_dir = os.path.join(data_directory, candidate.person)
+            name = os.path.basename(candidate.path)
+            prefix = LABEL_PREFIXES[candidate.label] + '_'
+            target = os.path.join(person_dir, name if name.startswith(prefix) else prefix + name)
+            if os.path.exists(target):
+                root, ext = os.path.splitext(target)
+                target = f"{root}_{hashes[i][0][:8]}{ext}"
+            try:
+                os.makedirs(person_dir, exist_ok=True)
+                (shutil.move if move else shutil.copy2)(candidate.path, target)
+            except OSError as e:
+                skipped.append((candidate.path, f"could not be placed in {person_dir}: {e}"))
+                stats['skipped'] += 1
+                continue
+            placed.append(target)
+            kept.append(i)
+        accepted = kept
+
+    if store is not None and accepted:
+        entries = [{'sha256': hashes[i][0], 'phash': f"{hashes[i][1]:016x}", 'person': candidates[i].person,
+                    'label': candidates[i].label, 'source': os.path.basename(candidates[i].path)} for i in accepted]
+        store.write(images[accepted], [candidates[i].label for i in accepted],
+                    [candidates[i].person for i in accepted], entries, shard_size_mb)
+
+    stats['accepted'] = [candidates[i].path for i in accepted]
+    stats['placed'] = placed
+    stats['skipped_files'] = skipped
+    stats['near_duplicate_files'] = near_duplicate_files
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate, deduplicate and shard signature images in bulk.")
+    parser.add_argument('inputs', nargs='+', help="Image files or directories (searched recursively)")
+    parser.add_argument('--data', default='Data', help="Data directory; shards go to its cache folder by default")
+    parser.add_argument('--shards', help=f"Shard directory (default: <data>/{CACHE_DIR_NAME}/{SHARD_DIR_NAME})")
+    parser.add_argument('--person', help="Person for every file (default: each file's folder name)")
+    parser.add_argument('--label', choices=['original', 'forgeries'], help="Label for every file (default: filename prefix)")
+    parser.add_argument('--place', action='store_true', help="Also copy accepted files into <data>/<person>/")
+    parser.add_argument('--phash-distance', type=int, default=PHASH_DISTANCE,
+                        help="Near-duplicate threshold in bits, e.g. 2 (default -1: off)")
+    parser.add_argument('--shard-size-mb', type=int, default=SHARD_SIZE_MB)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    store = ShardStore(args.shards or os.path.join(args.data, CACHE_DIR_NAME, SHARD_DIR_NAME))
+    label = {'original': 0, 'forgeries': 1}.get(args.label)
+    stats = ingest(args.inputs, store, args.person, label, args.phash_distance, args.shard_size_mb,
+                   args.data if args.place else None, workers=args.workers)
+    for path, reason in stats['skipped_files']:
+        print(f"skipped {path}: {reason}")
+    for path, matched in stats['near_duplicate_files']:
+        print(f"near duplicate {path}: matches {matched}")
+    print(f"Accepted {len(stats['accepted'])}, invalid {stats['invalid']}, exact duplicates "
+          f"{stats['exact_duplicates']}, near duplicates {stats['near_duplicates']}, skipped {stats['skipped']}")
+    print(f"{len(store)} signatures in {len(store.manifest['shards'])} shards at {store.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
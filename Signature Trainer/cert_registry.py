@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import load_pem_x509_certificate
+from cryptography.x509.oid import NameOID
+
+CERTIFICATE_EXTENSIONS = ('.pem', '.crt')
+RELOAD_INTERVAL = 2.0  # Seconds between directory re-scans
+
+# The RSA-OAEP parameters used by the login protocol, built once and shared by every user
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),  # Use MGF1 with SHA256
+    algorithm=hashes.SHA256(),  # Use SHA256 for the padding algorithm
+    label=None
+)
+
+UserCertificate = namedtuple('UserCertificate', ['user', 'path', 'certificate', 'public_key'])
+
+
+def user_name_for(certificate, file_path):
+    """Names a user by the certificate's common name, falling back to the file name."""
+    common_names = certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    if common_names:
+        return common_names[0].value
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return name[:-len('_certificate')] if name.endswith('_certificate') else name
+
+
+class CertificateRegistry:
+    """
+    In-memory registry of user certificates loaded from a directory.
+
+    Every certificate is parsed once and its public key kept, so a login is a dict lookup.
+    The directory is re-scanned at most every `reload_interval` seconds; only files whose
+    mtime or size changed are re-parsed, so added, rotated and removed certificates are
+    picked up without restarting. Files that are not certificates (e.g. private keys kept
+    in the same folder) are skipped until they change.
+    """
+
+    def __init__(self, directory, reload_interval=RELOAD_INTERVAL, clock=time.monotonic):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._by_user = {}
+        self._by_path = {}  # path -> ((mtime_ns, size), UserCertificate or None)
+        self._last_scan = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """
+        Re-scans the directory now.
+
+        Returns:
+        dict: Counts of 'loaded', 'unchanged', 'removed' and 'skipped' (unparsable) files.
+        """
+        stats = {'loaded': 0, 'unchanged': 0, 'removed': 0, 'skipped': 0}
+        seen = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if not entry.name.lower().endswith(CERTIFICATE_EXTENSIONS) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            version = (stat.st_mtime_ns, stat.st_size)
+            cached = self._by_path.get(entry.path)
+            if cached is not None and cached[0] == version:
+                seen[entry.path] = cached
+                stats['unchanged' if cached[1] is not None else 'skipped'] += 1
+                continue
+            try:
+                with open(entry.path, 'rb') as cert_file:
+                    certificate = load_pem_x509_certificate(cert_file.read())
+                record = UserCertificate(user_name_for(certificate, entry.path), entry.path,
+                                         certificate, certificate.public_key())
+                stats['loaded'] += 1
+            except (OSError, ValueError):
+                record = None
+                stats['skipped'] += 1
+            seen[entry.path] = (version, record)
+
+        stats['removed'] = sum(1 for path, (_, record) in self._by_path.items()
+                               if path not in seen and record is not None)
+        by_user = {record.user: record for _, record in
+                   (seen[path] for path in sorted(seen)) if record is not None}
+        with self._lock:
+            self._by_path = seen
+            self._by_user = by_user
+            self._last_scan = self.clock()
+        return stats
+
+    def _maybe_reload(self):
+        if self.clock() - self._last_scan >= self.reload_interval:
+            self.reload()
+
+    def get(self, user):
+        """Returns the UserCertificate for `user`, or None if there is none."""
+        self._maybe_reload()
+        return self._by_user.get(user)
+
+    def users(self):
+        """Returns the names of all users with a valid certificate, sorted."""
+        self._maybe_reload()
+        return sorted(self._by_user)
+
+
+if __name__ == "__main__":
+    registry = CertificateRegistry(sys.argv[1] if len(sys.argv) > 1 else '.')
+    for name in registry.users():
+        record = registry.get(name)
+        print(f"{name}: {type(record.public_key).__name__} ({record.path})")
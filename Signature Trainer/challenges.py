@@ -0,0 +1,142 @@
+import heapq
+import secrets
+import threading
+import time
+import argparse
+from collections import namedtuple
+
+CHALLENGE_TTL = 60  # Seconds a challenge stays valid
+CHALLENGE_BYTES = 32
+
+# Outcomes of ChallengeStore.verify / ChallengeStore.status
+VALID = 'valid'
+UNKNOWN = 'unknown'  # Never issued, already used, or expired and purged
+EXPIRED = 'expired'
+MISMATCH = 'mismatch'
+WRONG_USER = 'wrong_user'
+
+Challenge = namedtuple('Challenge', ['challenge_id', 'user', 'secret', 'issued_at', 'expires_at'])
+
+
+class ChallengeStore:
+    """
+    Holds any number of outstanding login challenges, each usable exactly once.
+
+    Challenges are looked up by challenge_id in a dict. Expiry order is kept in a min-heap
+    of (expires_at, challenge_id), so purging expired challenges only touches the ones
+    that actually expired instead of scanning everything outstanding. A challenge is
+    removed as soon as it is verified, successfully or not, so a captured response
+    cannot be replayed. All methods are thread-safe and independent of the GUI.
+    """
+
+    def __init__(self, ttl=CHALLENGE_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._challenges = {}
+        self._expiry_heap = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._challenges)
+
+    def _purge_expired(self, now):
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, challenge_id = heapq.heappop(heap)
+            challenge = self._challenges.get(challenge_id)
+            # Entries for challenges that were already used are simply dropped here
+            if challenge is not None and challenge.expires_at <= now:
+                del self._challenges[challenge_id]
+
+    def issue(self, user, ttl=None):
+        """Creates and stores a fresh random challenge for `user`."""
+        now = self.clock()
+        challenge = Challenge(secrets.token_hex(16), user, secrets.token_bytes(CHALLENGE_BYTES),
+                              now, now + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._purge_expired(now)
+            self._challenges[challenge.challenge_id] = challenge
+            heapq.heappush(self._expiry_heap, (challenge.expires_at, challenge.challenge_id))
+        return challenge
+
+    def status(self, challenge_id, user=None):
+        """Checks a challenge without using it up; returns VALID, UNKNOWN, EXPIRED or WRONG_USER."""
+        now = self.clock()
+        with self._lock:
+            challenge = self._challenges.get(challenge_id)
+            if challenge is None:
+                return UNKNOWN
+            if challenge.expires_at <= now:
+                return EXPIRED
+            if user is not None and challenge.user != user:
+                return WRONG_USER
+            return VALID
+
+    def verify(self, challenge_id, response, user=None, check=None):
+        """
+        Checks a client's response against a challenge and consumes the challenge.
+
+        A response on behalf of the wrong user leaves the challenge for its owner.
+
+        Args:
+        challenge_id (str): The id handed out with the challenge.
+        response (bytes): The client's response; by default the recovered challenge secret.
+        user (str): If given, the challenge must have been issued to this user.
+        check (callable): check(challenge, response) -> bool, for protocols where the response
+                          is not the secret itself (e.g. a signature over it).
+
+        Returns:
+        str: VALID, UNKNOWN, EXPIRED, WRONG_USER or MISMATCH.
+        """
+        now = self.clock()
+        with self._lock:
+            challenge = self._challenges.get(challenge_id)
+            if challenge is not None and user is not None and challenge.user != user \
+                    and challenge.expires_at > now:
+                return WRONG_USER  # Left in place, so another user cannot burn it
+            self._challenges.pop(challenge_id, None)
+            self._purge_expired(now)
+        if challenge is None:
+            return UNKNOWN
+        if challenge.expires_at <= now:
+            return EXPIRED
+        if check is None:
+            matched = secrets.compare_digest(challenge.secret, response)
+        else:
+            matched = check(challenge, response)
+        if not matched:
+            return MISMATCH
+        return VALID
+
+    def consume(self, challenge_id):
+        """Removes and returns a challenge (or None), for protocols that verify it themselves."""
+        now = self.clock()
+        with self._lock:
+            challenge = self._challenges.pop(challenge_id, None)
+            self._purge_expired(now)
+        if challenge is None or challenge.expires_at <= now:
+            return None
+        return challenge
+
+
+def benchmark(count=100000, users=1000):
+    """Measures issue and verify throughput of the store alone, in operations per second."""
+    store = ChallengeStore()
+    started = time.perf_counter()
+    challenges = [store.issue(f"user{i % users}") for i in range(count)]
+    issue_rate = count / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    valid = sum(store.verify(c.challenge_id, c.secret, c.user) == VALID for c in challenges)
+    verify_rate = count / (time.perf_counter() - started)
+    replayed = sum(store.verify(c.challenge_id, c.secret) == VALID for c in challenges[:1000])
+    return {'issue_per_second': issue_rate, 'verify_per_second': verify_rate,
+            'valid': valid, 'replays_accepted': replayed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the challenge store.")
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+    print(benchmark(args.count, args.users))
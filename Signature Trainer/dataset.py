@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from metrics import counter, timed
+
+TARGET_SIZE = (128, 128)  # (width, height) the trainer feeds to the CNN
+CACHE_DIR_NAME = '.cache'  # Lives inside the data directory; skipped by the directory walk
+CACHE_VERSION = 1
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+IMAGES_DECODED = counter('dataset_images_decoded_total', "Signature files decoded from disk")
+IMAGES_REUSED = counter('dataset_images_reused_total', "Signatures copied from the cache instead of decoded")
+
+
+def label_for(filename):
+    """Returns 0 for genuine, 1 for forged, or None for files that are not signatures."""
+    if filename.startswith('original_'):
+        return 0
+    if filename.startswith('forgeries_'):
+        return 1
+    return None
+
+
+def scan_signatures(directory_path):
+    """
+    Lists the signature files in a data directory without decoding them.
+
+    Args:
+    directory_path (str): The path to the directory containing subdirectories of individuals' signatures.
+
+    Returns:
+    list: (file_path, label, os.stat_result) for every signature file, sorted by person then filename.
+    """
+    entries = []
+    for person in sorted(os.scandir(directory_path), key=lambda e: e.name):
+        if person.name.startswith('.') or not person.is_dir():
+            continue
+        for file in sorted(os.scandir(person.path), key=lambda e: e.name):
+            label = label_for(file.name)
+            if label is None or not file.is_file():
+                continue
+            entries.append((file.path, label, file.stat()))
+    return entries
+
+
+@timed('dataset_load_signatures_seconds', "Time to load every signature with load_signatures")
+def load_signatures(directory_path):
+    """
+    Loads signature images from a specified directory, distinguishing between genuine and forged.
+
+    Args:
+    directory_path (str): The path to the directory containing subdirectories of individuals' signatures.
+
+    Returns:
+    list: A list of loaded signature images in grayscale.
+    list: A list of labels indicating whether each signature is genuine (0) or forged (1).
+    """
+    signatures = []
+    labels = []
+    for file_path, label, _ in scan_signatures(directory_path):
+        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue  # Skip files that are not readable images
+        signatures.append(image)
+        labels.append(label)
+    IMAGES_DECODED.inc(len(signatures))
+    return signatures, labels
+
+
+def parallel_for(count, work, workers=DEFAULT_WORKERS):
+    """
+    Calls work(start, stop) over contiguous index ranges covering range(count) on a thread pool.
+
+    OpenCV releases the GIL while decoding and resizing, so threads scale across cores
+    without the cost of shipping pixels between processes. Each range is handled by one
+    call, which lets work() reuse scratch buffers across the images it processes.
+    """
+    if count == 0:
+        return
+    workers = max(1, min(workers, count))
+    if workers == 1:
+        work(0, count)
+        return
+    chunk = -(-count // (workers * 4))  # Several chunks per worker to even out slow files
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda start: work(start, min(start + chunk, count)), range(0, count, chunk)))
+
+
+def decode_into(file_paths, out, rows=None, workers=DEFAULT_WORKERS):
+    """
+    Decodes grayscale image files and resizes them straight into a preallocated array.
+
+    Args:
+    file_paths (list): The image files to decode.
+    out (np.ndarray): uint8 array of shape (N, height, width) or (N, height, width, 3).
+    rows (list): Row of `out` for each file; defaults to 0..len(file_paths)-1.
+    workers (int): Number of decoding threads.
+
+    Returns:
+    np.ndarray: Boolean mask, False for files that could not be decoded (their rows are left untouched).
+    """
+    rows = range(len(file_paths)) if rows is None else rows
+    height, width = out.shape[1:3]
+    rgb = out.ndim == 4
+    decoded = np.zeros(len(file_paths), dtype=bool)
+
+    def work(start, stop):
+        resized = np.empty((height, width), dtype=np.uint8) if rgb else None
+        for i in range(start, stop):
+            image = cv2.imread(file_paths[i], cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                continue
+            if rgb:
+                cv2.resize(image, (width, height), dst=resized)
+                cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB, dst=out[rows[i]])
+            else:
+                cv2.resize(image, (width, height), dst=out[rows[i]])
+            decoded[i] = True
+
+    parallel_for(len(file_paths), work, workers)
+    return decoded
+
+
+@timed('dataset_to_rgb_seconds', "Time to resize and expand a set of images to RGB")
+def to_rgb(images, target_size=TARGET_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Resizes grayscale images and expands them to 3 channels in parallel.
+
+    Args:
+    images (sequence): Grayscale uint8 images, a list or an (N, height, width) array.
+    target_size (tuple): (width, height) of the output images.
+    workers (int): Number of threads.
+
+    Returns:
+    np.ndarray: uint8 array of shape (N, height, width, 3), in input order.
+    """
+    width, height = target_size
+    rgb_images = np.empty((len(images), height, width, 3), dtype=np.uint8)
+
+    def work(start, stop):
+        resized = np.empty((height, width), dtype=np.uint8)
+        for i in range(start, stop):
+            image = images[i]
+            if image.shape[:2] == (height, width):
+                cv2.cvtColor(image, cv2.COLOR_GRAY2RGB, dst=rgb_images[i])
+            else:
+                cv2.resize(image, target_size, dst=resized)
+                cv2.cvtColor(resized, cv2.COLOR_GRAY2RGB, dst=rgb_images[i])
+
+    parallel_for(len(images), work, workers)
+    return rgb_images
+
+
+@timed('dataset_load_signatures_rgb_seconds', "Time to decode every signature into an RGB array")
+def load_signatures_rgb(directory_path, target_size=TARGET_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Decodes every signature in parallel straight into one (N, height, width, 3) uint8 array.
+
+    Output order is the sorted directory order of scan_signatures, regardless of which
+    thread finishes first. Unreadable files are dropped.
+
+    Returns:
+    np.ndarray: uint8 RGB images.
+    np.ndarray: uint8 labels, 0 for genuine and 1 for forged.
+    """
+    width, height = target_size
+    scanned = scan_signatures(directory_path)
+    images = np.empty((len(scanned), height, width, 3), dtype=np.uint8)
+    labels = np.array([label for _, label, _ in scanned], dtype=np.uint8)
+    decoded = decode_into([file_path for file_path, _, _ in scanned], images, workers=workers)
+    if not decoded.all():
+        images, labels = images[decoded], labels[decoded]
+    return images, labels
+
+
+def cache_path_for(directory_path, target_size=TARGET_SIZE):
+    width, height = target_size
+    return os.path.join(directory_path, CACHE_DIR_NAME, f'signatures_{width}x{height}')
+
+
+def _read_index(cache_path, target_size):
+    try:
+        with open(os.path.join(cache_path, 'index.json')) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != CACHE_VERSION or tuple(index.get('target_size', ())) != tuple(target_size):
+        return None
+    return index
+
+
+def _write_atomic(path, write):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+@timed('dataset_update_cache_seconds', "Time to bring the signature cache up to date")
+def update_cache(directory_path, target_size=TARGET_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Brings the on-disk cache of resized grayscale signatures up to date.
+
+    Files are matched to cached rows by relative path, modification time and size, so only
+    new or changed images are decoded; everything else is copied from the existing cache.
+
+    Args:
+    directory_path (str): The data directory.
+    target_size (tuple): (width, height) the images are resized to before caching.
+    workers (int): Number of threads decoding new images.
+
+    Returns:
+    dict: Counts of 'total', 'decoded', 'reused', 'removed' and 'unreadable' files.
+    """
+    cache_path = cache_path_for(directory_path, target_size)
+    os.makedirs(cache_path, exist_ok=True)
+    width, height = target_size
+
+    index = _read_index(cache_path, target_size)
+    cached_rows = {}
+    cached_unreadable = {}
+    old_images = None
+    if index is not None:
+        cached_rows = {(e['path'], e['mtime_ns'], e['size']): row for row, e in enumerate(index['entries'])}
+        cached_unreadable = {(e['path'], e['mtime_ns'], e['size']): e for e in index['unreadable']}
+        if cached_rows:
+            old_images = np.load(os.path.join(cache_path, 'images.npy'), mmap_mode='r')
+
+    scanned = scan_signatures(directory_path)
+    images = np.empty((len(scanned), height, width), dtype=np.uint8)
+    entries = []
+    unreadable = []
+    pending = []  # (row, file_path) of images that have to be decoded
+    stats = {'total': 0, 'decoded': 0, 'reused': 0, 'removed': 0, 'unreadable': 0}
+    for file_path, label, stat in scanned:
+        entry = {
+            'path': os.path.relpath(file_path, directory_path).replace(os.sep, '/'),
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'label': label,
+        }
+        key = (entry['path'], entry['mtime_ns'], entry['size'])
+        if key in cached_unreadable:
+            unreadable.append(entry)
+            continue
+        if key in cached_rows:
+            images[len(entries)] = old_images[cached_rows.pop(key)]
+            stats['reused'] += 1
+        else:
+            pending.append((len(entries), file_path))
+        entries.append(entry)
+
+    if pending:
+        rows, file_paths = zip(*pending)
+        decoded = decode_into(file_paths, images, rows=rows, workers=workers)
+        stats['decoded'] = int(decoded.sum())
+        if not decoded.all():
+            keep = np.ones(len(entries), dtype=bool)
+            keep[np.array(rows)[~decoded]] = False
+            unreadable.extend(entry for entry, kept in zip(entries, keep) if not kept)
+            entries = [entry for entry, kept in zip(entries, keep) if kept]
+            images = images[np.flatnonzero(keep)]
+
+    stats['total'] = len(entries)
+    stats['removed'] = len(cached_rows)
+    stats['unreadable'] = len(unreadable)
+    IMAGES_DECODED.inc(stats['decoded'])
+    IMAGES_REUSED.inc(stats['reused'])
+    if index is not None and not stats['decoded'] and not stats['removed'] \
+            and {(e['path'], e['mtime_ns'], e['size']) for e in unreadable} == cached_unreadable.keys():
+        return stats  # Nothing changed on disk; keep the existing files
+
+    del old_images  # Release the old mapping before it is replaced
+    images = images[:len(entries)]
+    labels = np.array([entry['label'] for entry in entries], dtype=np.uint8)
+    _write_atomic(os.path.join(cache_path, 'images.npy'), lambda f: np.save(f, images))
+    _write_atomic(os.path.join(cache_path, 'labels.npy'), lambda f: np.save(f, labels))
+    index = {'version': CACHE_VERSION, 'target_size': list(target_size), 'entries': entries, 'unreadable': unreadable}
+    _write_atomic(os.path.join(cache_path, 'index.json'), lambda f: f.write(json.dumps(index).encode()))
+    return stats
+
+
+def load_cached_signatures(directory_path, target_size=TARGET_SIZE, update=True, workers=DEFAULT_WORKERS):
+    """
+    Loads all signatures from the cache, refreshing it first unless `update` is False.
+
+    Returns:
+    np.ndarray: Memory-mapped uint8 array of shape (N, height, width) of grayscale signatures.
+    np.ndarray: uint8 labels, 0 for genuine and 1 for forged.
+    """
+    if update:
+        update_cache(directory_path, target_size, workers)
+    cache_path = cache_path_for(directory_path, target_size)
+    images = np.load(os.path.join(cache_path, 'images.npy'), mmap_mode='r')
+    labels = np.load(os.path.join(cache_path, 'labels.npy'))
+    return images, labels
+
+
+def load_cache_index(directory_path, target_size=TARGET_SIZE):
+    """Returns the cache's per-file metadata (path, mtime_ns, size, label), in row order."""
+    index = _read_index(cache_path_for(directory_path, target_size), target_size)
+    return index['entries'] if index is not None else []
+
+
+if __name__ == "__main__":
+    data_directory = sys.argv[1] if len(sys.argv) > 1 else 'Data'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_WORKERS
+    print(update_cache(data_directory, workers=workers))
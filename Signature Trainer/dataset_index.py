@@ -0,0 +1,115 @@
+import os
+import sys
+import struct
+import sqlite3
+from dataset import CACHE_DIR_NAME, label_for, scan_signatures
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def read_png_size(file_path):
+    """
+    Reads a PNG's dimensions from its IHDR header without decoding the image.
+
+    Returns:
+    tuple: (width, height), or (None, None) if the file is not a PNG.
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(24)
+    if len(header) < 24 or not header.startswith(PNG_SIGNATURE) or header[12:16] != b'IHDR':
+        return None, None
+    return struct.unpack('>II', header[16:24])
+
+
+class DatasetIndex:
+    """
+    Persistent, metadata-only index of the signature files in a data directory.
+
+    Each signature file is recorded with its person folder, label, size, modification time
+    and pixel dimensions (read from the PNG header), in a small SQLite database inside the
+    data directory's cache folder. Counts and per-person breakdowns are answered from the
+    database; no image is ever decoded.
+    """
+
+    def __init__(self, directory_path, index_path=None):
+        self.directory_path = directory_path
+        if index_path is None:
+            os.makedirs(os.path.join(directory_path, CACHE_DIR_NAME), exist_ok=True)
+            index_path = os.path.join(directory_path, CACHE_DIR_NAME, 'index.sqlite')
+        self.connection = sqlite3.connect(index_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, person TEXT NOT NULL, label INTEGER NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, width INTEGER, height INTEGER)")
+
+    def close(self):
+        self.connection.close()
+
+    def _row(self, file_path, label, stat):
+        relative_path = os.path.relpath(file_path, self.directory_path).replace(os.sep, '/')
+        person = relative_path.split('/', 1)[0]
+        width, height = read_png_size(file_path)
+        return relative_path, person, label, stat.st_size, stat.st_mtime_ns, width, height
+
+    def refresh(self):
+        """
+        Synchronises the index with the directory using a stat-only os.scandir walk.
+
+        Only files that are new or whose size or mtime changed have their header read.
+
+        Returns:
+        dict: Counts of 'added', 'updated', 'removed' and 'unchanged' files.
+        """
+        known = {path: (size, mtime_ns) for path, size, mtime_ns
+                 in self.connection.execute("SELECT path, size, mtime_ns FROM files")}
+        stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        rows = []
+        for file_path, label, stat in scan_signatures(self.directory_path):
+            relative_path = os.path.relpath(file_path, self.directory_path).replace(os.sep, '/')
+            previous = known.pop(relative_path, None)
+            if previous == (stat.st_size, stat.st_mtime_ns):
+                stats['unchanged'] += 1
+                continue
+            stats['updated' if previous else 'added'] += 1
+            rows.append(self._row(file_path, label, stat))
+
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.connection.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in known])
+        stats['removed'] = len(known)
+        return stats
+
+    def add_files(self, file_paths):
+        """Records specific files (e.g. ones just added to the data directory) without a full walk."""
+        rows = []
+        for file_path in file_paths:
+            label = label_for(os.path.basename(file_path))
+            if label is not None and os.path.isfile(file_path):
+                rows.append(self._row(file_path, label, os.stat(file_path)))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def counts(self):
+        """Returns (total, genuine, forged) signature counts."""
+        genuine, forged = self.connection.execute(
+            "SELECT COALESCE(SUM(label = 0), 0), COALESCE(SUM(label = 1), 0) FROM files").fetchone()
+        return genuine + forged, genuine, forged
+
+    def person_counts(self):
+        """Returns {person: (genuine, forged)} for every person folder in the index."""
+        return {person: (genuine, forged) for person, genuine, forged in self.connection.execute(
+            "SELECT person, SUM(label = 0), SUM(label = 1) FROM files GROUP BY person ORDER BY person")}
+
+    def total_bytes(self):
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+
+if __name__ == "__main__":
+    index = DatasetIndex(sys.argv[1] if len(sys.argv) > 1 else 'Data')
+    print(index.refresh())
+    total, genuine, forged = index.counts()
+    print(f"Total signatures: {total} (Genuine: {genuine}, Forged: {forged}, {index.total_bytes()} bytes)")
+    for person, (genuine, forged) in index.person_counts().items():
+        print(f"  {person}: Genuine {genuine}, Forged {forged}")
+    index.close()
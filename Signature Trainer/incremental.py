@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.callbacks import Callback
+from dataset import update_cache
+from pipeline import make_dataset
+from training import BATCH_SIZE, EPOCH_SECONDS, load_manifest, save_manifest, training_entries, load_training_set
+from metrics import timed, instrument_from_env
+
+EPOCHS = 3  # Fine-tuning epochs over the new samples plus the replay buffer
+LEARNING_RATE = 1e-4  # A tenth of Adam's default, so fine-tuning nudges rather than overwrites the weights
+REPLAY_RATIO = 4  # Previously trained samples replayed per new sample
+MIN_REPLAY = 64  # Replayed samples however few signatures were added
+VALIDATION_SAMPLES = 256  # Previously trained samples held out to validate the fine-tuned model
+NEW_VALIDATION_FRACTION = 0.2  # Share of the new samples held out to check the fine-tuned model on them too
+CHECKPOINT_DIR_NAME = 'incremental_checkpoint'
+
+
+def _entry_key(entry):
+    return entry['path'], entry['mtime_ns'], entry['size']
+
+
+def find_new_samples(entries, model_path):
+    """
+    Splits the cache entries into those the model has and has not been trained on.
+
+    Uses the model's manifest; without one (a model trained before manifests existed) any
+    file modified after the model was saved counts as new.
+
+    Returns:
+    np.ndarray: Row indices of the new samples.
+    np.ndarray: Row indices of the samples already trained on.
+    """
+    trained = load_manifest(model_path)
+    if trained is not None:
+        is_new = np.array([_entry_key(e) not in trained for e in entries], dtype=bool)
+    else:
+        model_mtime_ns = os.stat(model_path).st_mtime_ns
+        is_new = np.array([e['mtime_ns'] > model_mtime_ns for e in entries], dtype=bool)
+    return np.flatnonzero(is_new), np.flatnonzero(~is_new)
+
+
+def _write_json_atomic(path, data):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+class EpochCheckpoint(Callback):
+    """Saves the full model (weights and optimizer state) and the run state after every epoch."""
+
+    def __init__(self, checkpoint_dir, state):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.state = state
+        self.started = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        EPOCH_SECONDS.observe(time.perf_counter() - self.started)
+        model_path = os.path.join(self.checkpoint_dir, 'model.keras')
+        self.model.save(model_path + '.tmp.keras')
+        os.replace(model_path + '.tmp.keras', model_path)
+        for key, value in (logs or {}).items():
+            self.state['history'].setdefault(key, []).append(float(value))
+        if logs and logs.get('val_loss', np.inf) < self.state['best_val_loss']:
+            self.state['best_val_loss'] = float(logs['val_loss'])
+            self.state['best_val_accuracy'] = float(logs.get('val_accuracy', np.nan))
+            shutil.copyfile(model_path, os.path.join(self.checkpoint_dir, 'best.keras'))
+        self.state['epochs_done'] = epoch + 1
+        _write_json_atomic(os.path.join(self.checkpoint_dir, 'state.json'), self.state)
+
+
+@timed('training_incremental_seconds', "Time of an incremental fine-tuning run")
+def fine_tune(data_directory, model_path='best_model.h5', epochs=EPOCHS, batch_size=BATCH_SIZE,
+              learning_rate=LEARNING_RATE, replay_ratio=REPLAY_RATIO, seed=None, resume=True, shard_directory=None):
+    """
+    Fine-tunes the current best model on newly added signatures instead of retraining every fold.
+
+    The new samples are mixed with a random replay buffer of `replay_ratio` previously
+    trained samples each, so the model does not drift towards the handful of new writers.
+    A held-out sample of earlier data picks the best epoch, and a held-out share of the new
+    samples checks that model on the new writers too; held-out new samples stay new and are
+    trained on by a later run. After every epoch the model and the run state are checkpointed
+    next to the model; an interrupted run resumes from the last completed epoch with the
+    same samples. The fine-tuned model replaces `model_path` only if its loss on both
+    validation sets, and its accuracy on the new one, are no worse than the original model's.
+
+    Args:
+    data_directory (str): The data directory (its cache is refreshed first); unused with shards.
+    model_path (str): The model to fine-tune and, if improved, replace.
+    epochs (int): Epochs over the new samples and replay buffer.
+    batch_size (int): Training batch size.
+    learning_rate (float): Adam learning rate for fine-tuning.
+    replay_ratio (int): Previously trained samples replayed per new sample.
+    seed (int): Fixes the replay and validation samples and the augmentation.
+    resume (bool): Continue an interrupted run if a checkpoint exists.
+    shard_directory (str): Fine-tune on the bulk-ingested shards there instead of the data directory.
+
+    Returns:
+    dict: 'new_samples' (trained on), 'new_validation' (held out), 'replayed', 'epochs_run',
+          'resumed', loss and accuracy before and after on the earlier samples ('base_val_loss',
+          'val_loss', 'base_val_accuracy', 'val_accuracy') and on the held-out new ones
+          ('base_new_val_loss', 'new_val_loss', 'base_new_val_accuracy', 'new_val_accuracy'),
+          'history' and 'promoted' (whether model_path was replaced). Unmeasured values are None.
+    """
+    checkpoint_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), CHECKPOINT_DIR_NAME)
+    state_path = os.path.join(checkpoint_dir, 'state.json')
+
+    if not shard_directory:
+        update_cache(data_directory)
+    images, labels = load_training_set(data_directory, shard_directory)
+    entries = training_entries(data_directory, shard_directory)
+    row_for_path = {entry['path']: row for row, entry in enumerate(entries)}
+
+    state = None
+    if resume and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    resumed = state is not None
+    if not resumed and os.path.exists(checkpoint_dir):
+        shutil.rmtree(checkpoint_dir)  # Left over from a run that is not being resumed
+    if state is None:
+        new_idx, old_idx = find_new_samples(entries, model_path)
+        if not len(new_idx):
+            return {'new_samples': 0, 'new_validation': 0, 'replayed': 0, 'epochs_run': 0, 'resumed': False,
+                    'base_val_loss': None, 'val_loss': None, 'base_val_accuracy': None, 'val_accuracy': None,
+                    'base_new_val_loss': None, 'new_val_loss': None, 'base_new_val_accuracy': None,
+                    'new_val_accuracy': None, 'history': {}, 'promoted': False}
+        rng = np.random.default_rng(seed)
+        new_idx = rng.permutation(new_idx)
+        new_val_idx = new_idx[:int(len(new_idx) * NEW_VALIDATION_FRACTION)]  # None when only a few were added
+        new_idx = new_idx[len(new_val_idx):]
+        held_out = set(new_val_idx.tolist())
+        old_idx = rng.permutation(old_idx)
+        val_idx = old_idx[:min(VALIDATION_SAMPLES, len(old_idx) // 5)]
+        replay_pool = old_idx[len(val_idx):]
+        replay_idx = replay_pool[:max(MIN_REPLAY, replay_ratio * len(new_idx))]
+        state = {
+            'new_paths': [entries[i]['path'] for i in new_idx],
+            'replay_paths': [entries[i]['path'] for i in replay_idx],
+            'val_paths': [entries[i]['path'] for i in val_idx],
+            'new_val_paths': [entries[i]['path'] for i in new_val_idx],
+            # Previously trained plus new samples as of this run's start, less the held-out new ones;
+            # those and files added while an interrupted run waits to resume stay new for the next run
+            'trained_entries': [{'path': e['path'], 'mtime_ns': e['mtime_ns'], 'size': e['size']}
+                                for i, e in enumerate(entries) if i not in held_out],
+            'seed': seed,
+            'epochs': epochs,
+            'epochs_done': 0,
+            'best_val_loss': float('inf'),
+            'best_val_accuracy': None,
+            'base_val_loss': None,
+            'base_val_accuracy': None,
+            'base_new_val_loss': None,
+            'base_new_val_accuracy': None,
+            'history': {},
+        }
+
+    # Rows are looked up by path so a resumed run trains on the same samples
+    def rows(paths):
+        return np.array([row_for_path[p] for p in paths if p in row_for_path], dtype=np.int64)
+    new_idx, replay_idx, val_idx = rows(state['new_paths']), rows(state['replay_paths']), rows(state['val_paths'])
+    new_val_idx = rows(state['new_val_paths'])
+    train_idx = np.concatenate([new_idx, replay_idx])
+
+    if state['seed'] is not None:
+        tf.keras.utils.set_random_seed(state['seed'] + state['epochs_done'])
+    train_ds = make_dataset(images, labels, train_idx, batch_size=batch_size, augment=True, shuffle=True,
+                            seed=state['seed'])
+    val_ds = make_dataset(images, labels, val_idx, batch_size=batch_size) if len(val_idx) else None
+    new_val_ds = make_dataset(images, labels, new_val_idx, batch_size=batch_size) if len(new_val_idx) else None
+
+    checkpoint_path = os.path.join(checkpoint_dir, 'model.keras')
+    if resumed and os.path.exists(checkpoint_path):
+        model = load_model(checkpoint_path)  # Restores the optimizer state too
+    else:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        model = load_model(model_path, compile=False)
+        model.compile(optimizer=Adam(learning_rate), loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+        if val_ds is not None and state['base_val_loss'] is None:
+            state['base_val_loss'], state['base_val_accuracy'] = map(float, model.evaluate(val_ds, verbose=0))
+        if new_val_ds is not None and state['base_new_val_loss'] is None:
+            state['base_new_val_loss'], state['base_new_val_accuracy'] = map(float, model.evaluate(new_val_ds, verbose=0))
+        _write_json_atomic(state_path, state)
+
+    epochs_run = state['epochs'] - state['epochs_done']
+    if epochs_run > 0:
+        model.fit(train_ds, epochs=state['epochs'], initial_epoch=state['epochs_done'], validation_data=val_ds,
+                  callbacks=[EpochCheckpoint(checkpoint_dir, state)], verbose=2)
+
+    best_path = os.path.join(checkpoint_dir, 'best.keras')
+    if not os.path.exists(best_path):
+        best_path = os.path.join(checkpoint_dir, 'model.keras')
+    best_model = load_model(best_path)
+    new_val_loss = new_val_accuracy = None
+    if new_val_ds is not None:
+        new_val_loss, new_val_accuracy = map(float, best_model.evaluate(new_val_ds, verbose=0))
+    promoted = ((state['base_val_loss'] is None or state['best_val_loss'] <= state['base_val_loss']) and
+                (new_val_loss is None or (new_val_loss <= state['base_new_val_loss'] and
+                                          new_val_accuracy >= state['base_new_val_accuracy'])))
+    if promoted:
+        best_model.save(model_path)
+        save_manifest(model_path, state['trained_entries'])
+    shutil.rmtree(checkpoint_dir)
+    return {
+        'new_samples': len(new_idx),
+        'new_validation': len(new_val_idx),
+        'replayed': len(replay_idx),
+        'epochs_run': epochs_run,
+        'resumed': resumed,
+        'base_val_loss': state['base_val_loss'],
+        'val_loss': None if state['best_val_loss'] == float('inf') else state['best_val_loss'],
+        'base_val_accuracy': state['base_val_accuracy'],
+        'val_accuracy': state['best_val_accuracy'],
+        'base_new_val_loss': state['base_new_val_loss'],
+        'new_val_loss': new_val_loss,
+        'base_new_val_accuracy': state['base_new_val_accuracy'],
+        'new_val_accuracy': new_val_accuracy,
+        'history': state['history'],
+        'promoted': promoted,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune the best model on newly added signatures.")
+    parser.add_argument('data_directory', nargs='?', default='Data')
+    parser.add_argument('--model', default='best_model.h5')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--replay-ratio', type=int, default=REPLAY_RATIO)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--restart', action='store_true', help="Discard an interrupted run instead of resuming it")
+    parser.add_argument('--shards', help="Shard directory to fine-tune on instead of the data directory")
+    args = parser.parse_args(argv)
+    instrument_from_env()
+
+    result = fine_tune(args.data_directory, args.model, args.epochs, args.batch_size, args.learning_rate,
+                       args.replay_ratio, args.seed, resume=not args.restart, shard_directory=args.shards)
+    if not result['new_samples']:
+        print("No new signatures since the model was trained.")
+        return 0
+    print(f"{'Resumed' if result['resumed'] else 'Fine-tuned'} on {result['new_samples']} new and "
+          f"{result['replayed']} replayed signatures for {result['epochs_run']} epochs "
+          f"({result['new_validation']} new held out)")
+    for name, prefix in (("Earlier signatures", ''), ("New signatures", 'new_')):
+        if result[f'base_{prefix}val_loss'] is not None and result[f'{prefix}val_loss'] is not None:
+            print(f"{name}: loss {result[f'base_{prefix}val_loss']:.4f} before, {result[f'{prefix}val_loss']:.4f} after; "
+                  f"accuracy {result[f'base_{prefix}val_accuracy']:.2%} before, {result[f'{prefix}val_accuracy']:.2%} after")
+    print(f"{args.model} {'updated' if result['promoted'] else 'kept (fine-tuned model was not better)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
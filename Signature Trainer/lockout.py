@@ -0,0 +1,144 @@
+import time
+import threading
+import argparse
+from collections import OrderedDict
+
+MAX_LOCKOUT = 30  # Seconds; the longest back-off after repeated failures
+BUCKET_CAPACITY = 5  # Attempts allowed in a burst
+REFILL_PER_SECOND = 0.5  # Sustained attempts per second once the burst is used up
+FORGET_AFTER = 15 * 60  # Seconds without a failure after which the failure count starts over
+MAX_PRINCIPALS = 100000  # Tracked users/clients; the least recently seen are evicted beyond this
+
+
+class _State:
+    __slots__ = ('tokens', 'refilled_at', 'failures', 'failed_at', 'locked_until')
+
+    def __init__(self, now, capacity):
+        self.tokens = float(capacity)
+        self.refilled_at = now
+        self.failures = 0
+        self.failed_at = now
+        self.locked_until = 0.0
+
+
+class Throttle:
+    """
+    Per-principal rate limiting and exponential lockout, independent of any GUI.
+
+    A principal is any hashable key, typically a user name or a client address; callers
+    pass every key an attempt should count against (e.g. the user and the client). Each
+    key has a token bucket limiting the attempt rate and a failure counter that locks it
+    out for min(max_lockout, 2 ** failures) seconds after each failure, as the login
+    screen always has.
+
+    Everything is computed from monotonic timestamps when a key is touched, so there are
+    no timers and each call is O(1) per key. State lives in an LRU-ordered dict capped at
+    `max_principals` entries. Evicting a key forgets its history, so the cap should sit well
+    above the number of principals active within `forget_after`.
+    """
+
+    def __init__(self, max_lockout=MAX_LOCKOUT, capacity=BUCKET_CAPACITY, refill_per_second=REFILL_PER_SECOND,
+                 forget_after=FORGET_AFTER, max_principals=MAX_PRINCIPALS, clock=time.monotonic):
+        self.max_lockout = max_lockout
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.forget_after = forget_after
+        self.max_principals = max_principals
+        self.clock = clock
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def _state(self, key, now):
+        state = self._states.get(key)
+        if state is None:
+            state = _State(now, self.capacity)
+            self._states[key] = state
+            if len(self._states) > self.max_principals:
+                self._states.popitem(last=False)  # Evict the least recently used principal
+        else:
+            self._states.move_to_end(key)
+            if state.failures and now - state.failed_at >= self.forget_after:
+                state.failures = 0
+        state.tokens = min(self.capacity, state.tokens + (now - state.refilled_at) * self.refill_per_second)
+        state.refilled_at = now
+        return state
+
+    def attempt(self, *keys):
+        """
+        Registers an authentication attempt against every key.
+
+        Returns:
+        float: 0 if the attempt may proceed, otherwise the seconds to wait. A refused
+               attempt consumes nothing.
+        """
+        now = self.clock()
+        with self._lock:
+            states = [self._state(key, now) for key in keys]
+            wait = 0.0
+            for state in states:
+                wait = max(wait, state.locked_until - now)
+                if state.tokens < 1:
+                    wait = max(wait, (1 - state.tokens) / self.refill_per_second)
+            if wait > 0:
+                return wait
+            for state in states:
+                state.tokens -= 1
+            return 0.0
+
+    def failure(self, *keys):
+        """
+        Records a failed attempt and locks the keys out with exponential back-off.
+
+        Returns:
+        int: The lockout applied, in seconds (the longest across keys).
+        """
+        now = self.clock()
+        lockout = 0
+        with self._lock:
+            for key in keys:
+                state = self._state(key, now)
+                state.failures += 1
+                state.failed_at = now
+                duration = min(self.max_lockout, 2 ** min(state.failures, 32))
+                state.locked_until = max(state.locked_until, now + duration)
+                lockout = max(lockout, duration)
+        return lockout
+
+    def success(self, *keys):
+        """Clears the failure history of the keys after a successful authentication."""
+        now = self.clock()
+        with self._lock:
+            for key in keys:
+                state = self._state(key, now)
+                state.failures = 0
+                state.locked_until = 0.0
+
+    def remaining(self, *keys):
+        """Seconds until every key's lockout has ended, without counting an attempt."""
+        now = self.clock()
+        with self._lock:
+            return max([self._states[key].locked_until - now for key in keys if key in self._states] + [0.0])
+
+
+def benchmark(attempts=500000, clients=10000):
+    """Measures attempt/failure throughput across many clients, in operations per second."""
+    throttle = Throttle(max_principals=clients // 2)  # Small cap so eviction is exercised too
+    started = time.perf_counter()
+    for i in range(attempts):
+        client = f"client{i % clients}"
+        if throttle.attempt(client) == 0 and i % 7 == 0:
+            throttle.failure(client)
+    elapsed = time.perf_counter() - started
+    return {'attempts_per_second': attempts / elapsed, 'tracked': len(throttle)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the lockout throttle.")
+    parser.add_argument('--attempts', type=int, default=500000)
+    parser.add_argument('--clients', type=int, default=10000)
+    args = parser.parse_args()
+    result = benchmark(args.attempts, args.clients)
+    print(f"{int(result['attempts_per_second'])} attempts/s, {result['tracked']} principals tracked")
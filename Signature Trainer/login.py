@@ -0,0 +1,112 @@
+import logging
+from audit import audit_event
+from challenges import ChallengeStore, VALID, UNKNOWN
+from lockout import Throttle
+from protocols import protocol_for, server_payload, verify_response
+from metrics import counter, histogram
+
+LOCKED_OUT = 'locked_out'
+KEY_ERROR = 'key_error'
+
+# Timings of the crypto steps only; the time a user spends in the dialogs is not measured
+ISSUE_SECONDS = histogram('auth_issue_seconds', "Time to issue a challenge and build its payload")
+VERIFY_SECONDS = histogram('auth_verify_seconds', "Time to verify a response against the certificate")
+LOGINS_TOTAL = counter('auth_logins_total', "Challenges issued")
+SUCCESS_TOTAL = counter('auth_success_total', "Successful authentications")
+FAILURE_TOTAL = counter('auth_failures_total', "Failed or refused authentication attempts")
+
+
+class LoginServer:
+    """
+    The server side of a challenge-response login, without any UI.
+
+    Every login goes through issue(), begin_attempt() and finish(): certificate lookup,
+    challenge issue and verification, the lockout, the metrics and the audit records all
+    happen here, so the GUI and the benchmarks exercise the same path.
+
+    Attempts are throttled per (user, client) pair and per client, never per user alone,
+    so failing on someone else's behalf locks out the failing client rather than the user.
+    """
+
+    def __init__(self, certificates, challenges=None, lockout=None):
+        self.certificates = certificates
+        self.challenges = challenges if challenges is not None else ChallengeStore()
+        self.lockout = lockout if lockout is not None else Throttle()
+
+    def issue(self, user):
+        """
+        Issues a challenge to a user and builds the payload the client has to answer.
+
+        Returns:
+        tuple: (Challenge, payload, protocol mode), or None if the user has no certificate.
+        """
+        user_certificate = self.certificates.get(user)
+        if user_certificate is None:
+            audit_event('certificate_missing', logging.WARNING, user=user)
+            return None
+        public_key = user_certificate.public_key
+        with ISSUE_SECONDS.time():
+            challenge = self.challenges.issue(user)
+            mode = protocol_for(public_key)
+            payload = server_payload(challenge, public_key)
+        LOGINS_TOTAL.inc()
+        audit_event('challenge_issued', user=user, challenge_id=challenge.challenge_id, mode=mode)  # Never its contents
+        return challenge, payload, mode
+
+    @staticmethod
+    def _principals(user, client):
+        return (user, client), ('client', client)
+
+    def begin_attempt(self, user, challenge_id, client):
+        """
+        Counts a login attempt and checks its challenge is still open, before the client answers it.
+
+        Returns:
+        str: VALID to go ahead, LOCKED_OUT, or the challenge's status (EXPIRED, UNKNOWN, WRONG_USER).
+        float: Seconds until the client may try again when LOCKED_OUT, otherwise 0.
+        """
+        wait = self.lockout.attempt(*self._principals(user, client))
+        if wait > 0:
+            audit_event('challenge_failed', logging.WARNING, user=user, client=client, challenge_id=challenge_id,
+                        reason=LOCKED_OUT, retry_after=round(wait, 3))
+            FAILURE_TOTAL.inc()
+            return LOCKED_OUT, wait
+        status = self.challenges.status(challenge_id)  # Without using it up
+        if status != VALID:
+            audit_event('challenge_failed', logging.WARNING, user=user, client=client, challenge_id=challenge_id,
+                        reason=status)
+        return status, 0.0
+
+    def client_error(self, user, challenge_id, error, client):
+        """Records a client that could not answer the challenge, e.g. with an unreadable key file."""
+        audit_event('challenge_failed', logging.ERROR, user=user, client=client, challenge_id=challenge_id,
+                    reason=KEY_ERROR, error=str(error))
+        self._failed(user, client)
+
+    def finish(self, user, challenge_id, response, client):
+        """
+        Verifies the client's response, consuming the challenge, and updates the client's lockout.
+
+        Returns:
+        str: One of the challenges module outcomes (VALID, UNKNOWN, EXPIRED, WRONG_USER, MISMATCH).
+        """
+        user_certificate = self.certificates.get(user)
+        status = UNKNOWN
+        if user_certificate is not None:
+            with VERIFY_SECONDS.time():
+                status = verify_response(self.challenges, challenge_id, user, user_certificate.public_key, response)
+        if status == VALID:
+            self.lockout.success((user, client))  # The client keeps its failures against other users
+            SUCCESS_TOTAL.inc()
+            audit_event('challenge_verified', user=user, client=client, challenge_id=challenge_id)
+        else:
+            audit_event('challenge_failed', logging.WARNING, user=user, client=client, challenge_id=challenge_id,
+                        reason=status)
+            self._failed(user, client)
+        return status
+
+    def _failed(self, user, client):
+        # Only this client is locked out, for this user and overall; the lockout ends on its own, no timer needed
+        lockout_duration = self.lockout.failure(*self._principals(user, client))
+        FAILURE_TOTAL.inc()
+        audit_event('locked_out', logging.WARNING, user=user, client=client, seconds=lockout_duration)
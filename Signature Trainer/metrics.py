@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import functools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float('inf'))
+
+# Environment variables read by instrument_from_env()
+METRICS_PORT_ENV = 'SIGNATURE_METRICS_PORT'  # Serve Prometheus text on this port at /metrics
+METRICS_JSON_ENV = 'SIGNATURE_METRICS_JSON'  # Periodically dump a JSON snapshot to this file
+METRICS_INTERVAL_ENV = 'SIGNATURE_METRICS_INTERVAL'  # Seconds between JSON dumps (default 10)
+PROFILE_ENV = 'SIGNATURE_PROFILE'  # Comma-separated: 'cprofile' and/or 'tracemalloc'
+PROFILE_DIR_ENV = 'SIGNATURE_PROFILE_DIR'  # Where profiles are written at exit (default: cwd)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(buckets)
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[min(index, len(self.counts) - 1)] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager that observes the duration of its block."""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Estimates a quantile as the upper bound of the bucket it falls in."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            running = 0
+            for bound, count in zip(self.bounds, self.counts):
+                running += count
+                if running >= target:
+                    return bound
+        return self.bounds[-1]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    """Process-wide collection of named counters and histograms."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in sorted(self._metrics.values(), key=lambda m: m.name):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {metric.name} counter")
+                lines.append(f"{metric.name} {metric.value}")
+                continue
+            lines.append(f"# TYPE {metric.name} histogram")
+            with metric._lock:
+                counts, total, observed = list(metric.counts), metric.sum, metric.count
+            running = 0
+            for bound, count in zip(metric.bounds, counts):
+                running += count
+                label = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric.name}_bucket{{le="{label}"}} {running}')
+            lines.append(f"{metric.name}_sum {total}")
+            lines.append(f"{metric.name}_count {observed}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Returns all metrics as a JSON-serialisable dict."""
+        result = {'timestamp': time.time()}
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, Counter):
+                result[metric.name] = metric.value
+            else:
+                result[metric.name] = {
+                    'count': metric.count,
+                    'sum': metric.sum,
+                    'mean': metric.sum / metric.count if metric.count else None,
+                    'p50': metric.quantile(0.5),
+                    'p95': metric.quantile(0.95),
+                    'p99': metric.quantile(0.99),
+                }
+        return result
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text=''):
+    return REGISTRY.counter(name, help_text)
+
+
+def histogram(name, help_text=''):
+    return REGISTRY.histogram(name, help_text)
+
+
+def timed(name, help_text=''):
+    """Decorator recording every call's duration in the histogram `name`."""
+    metric = REGISTRY.histogram(name, help_text)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metric.time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+    """Serves registry.render_prometheus() at http://host:port/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes are not worth a log line each
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def start_json_dump(path, interval=10.0, registry=REGISTRY):
+    """Writes registry.snapshot() to `path` every `interval` seconds, and once more at exit."""
+    stop = threading.Event()
+
+    def dump():
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(registry.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+    def run():
+        while not stop.wait(interval):
+            dump()
+
+    threading.Thread(target=run, name='metrics-json', daemon=True).start()
+
+    def finish():
+        stop.set()
+        dump()
+    atexit.register(finish)
+    return stop
+
+
+def enable_profiling(modes, output_dir='.'):
+    """
+    Profiles the rest of this run and writes the results at exit.
+
+    Args:
+    modes (iterable): 'cprofile' writes profile-<pid>.prof (open with pstats or snakeviz);
+                      'tracemalloc' writes tracemalloc-<pid>.txt with the top allocation sites.
+    output_dir (str): Directory the files are written to.
+    """
+    modes = {mode.strip().lower() for mode in modes if mode.strip()}
+    os.makedirs(output_dir, exist_ok=True)
+    pid = os.getpid()
+    if 'cprofile' in modes:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def write_profile():
+            profiler.disable()
+            profiler.dump_stats(os.path.join(output_dir, f'profile-{pid}.prof'))
+        atexit.register(write_profile)
+    if 'tracemalloc' in modes:
+        import tracemalloc
+        tracemalloc.start(10)
+
+        def write_allocations():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            with open(os.path.join(output_dir, f'tracemalloc-{pid}.txt'), 'w') as f:
+                f.write(f"current={current} peak={peak}\n")
+                for stat in snapshot.statistics('lineno')[:50]:
+                    f.write(f"{stat}\n")
+        atexit.register(write_allocations)
+
+
+def instrument_from_env():
+    """Enables the metric exports and profilers requested through the SIGNATURE_* environment variables."""
+    if os.environ.get(PROFILE_ENV):
+        enable_profiling(os.environ[PROFILE_ENV].split(','), os.environ.get(PROFILE_DIR_ENV, '.'))
+    if os.environ.get(METRICS_PORT_ENV):
+        start_http_server(int(os.environ[METRICS_PORT_ENV]))
+    if os.environ.get(METRICS_JSON_ENV):
+        start_json_dump(os.environ[METRICS_JSON_ENV], float(os.environ.get(METRICS_INTERVAL_ENV, 10)))
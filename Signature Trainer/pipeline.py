@@ -0,0 +1,107 @@
+import math
+import numpy as np
+import tensorflow as tf
+
+# Same augmentation ranges the trainer used with ImageDataGenerator
+ROTATION_RANGE = 5  # Degrees
+WIDTH_SHIFT_RANGE = 0.05  # Fraction of the width
+HEIGHT_SHIFT_RANGE = 0.05  # Fraction of the height
+SHEAR_RANGE = 0.05  # Degrees, as ImageDataGenerator interprets it
+ZOOM_RANGE = 0.05
+
+
+def random_affine(images, seed):
+    """
+    Applies ImageDataGenerator-style random rotation, shift, shear, zoom and horizontal flip.
+
+    All geometric transforms for an image are composed into one projective transform and
+    applied in a single pass with 'nearest' edge filling, on the whole batch at once.
+
+    Args:
+    images (tf.Tensor): float32 batch of shape (B, height, width, channels).
+    seed (tf.Tensor): Shape (2,) int seed for the stateless random draws.
+
+    Returns:
+    tf.Tensor: The augmented batch, same shape and dtype.
+    """
+    batch = tf.shape(images)[0]
+    height = tf.cast(tf.shape(images)[1], tf.float32)
+    width = tf.cast(tf.shape(images)[2], tf.float32)
+    seeds = tf.random.experimental.stateless_split(seed, num=7)
+
+    def uniform(i, limit):
+        return tf.random.stateless_uniform([batch], seeds[i], -limit, limit)
+
+    theta = uniform(0, ROTATION_RANGE * math.pi / 180)
+    shear = uniform(1, SHEAR_RANGE * math.pi / 180)
+    tx = uniform(2, WIDTH_SHIFT_RANGE) * width
+    ty = uniform(3, HEIGHT_SHIFT_RANGE) * height
+    zx = 1.0 + uniform(4, ZOOM_RANGE)
+    zy = 1.0 + uniform(5, ZOOM_RANGE)
+    flip = tf.random.stateless_uniform([batch], seeds[6]) < 0.5
+
+    # Output -> input pixel mapping: rotate, shear and zoom about the centre, then shift
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    a0 = zx * tf.cos(theta)
+    a1 = -zy * tf.sin(theta + shear)
+    b0 = zx * tf.sin(theta)
+    b1 = zy * tf.cos(theta + shear)
+    a2 = cx - a0 * cx - a1 * cy + tx
+    b2 = cy - b0 * cx - b1 * cy + ty
+    zeros = tf.zeros([batch])
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+    images = tf.where(flip[:, None, None, None], tf.image.flip_left_right(images), images)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms, output_shape=tf.shape(images)[1:3],
+        fill_value=0.0, interpolation='BILINEAR', fill_mode='NEAREST')
+
+
+def make_dataset(images, labels, indices, batch_size=32, augment=False, shuffle=False, seed=None):
+    """
+    Streams a subset of the signatures to the model without copying the dataset.
+
+    Only the int64 indices are shuffled and batched; the uint8 grayscale pixels for each
+    batch are gathered from `images` (typically the memory-mapped cache) when the batch
+    is produced, then converted to float32, augmented and expanded to 3 channels on the
+    fly, with prefetching overlapping that work with training.
+
+    Args:
+    images (np.ndarray): uint8 grayscale images of shape (N, height, width); may be a memmap.
+    labels (np.ndarray): Labels for all N images.
+    indices (np.ndarray): The rows of this subset, e.g. a fold's train_idx.
+    batch_size (int): Images per batch.
+    augment (bool): Apply the random training augmentations.
+    shuffle (bool): Reshuffle the subset every epoch.
+    seed (int): Makes shuffling and augmentation reproducible.
+
+    Returns:
+    tf.data.Dataset: Batches of (float32 (B, height, width, 3) in [0, 1], int32 labels).
+    """
+    height, width = images.shape[1:3]
+    indices = np.asarray(indices, dtype=np.int64)
+    labels = np.asarray(labels)
+
+    def gather(batch_indices):
+        batch_indices = np.sort(batch_indices)  # Sequential reads from the memmap
+        return images[batch_indices], labels[batch_indices].astype(np.int32)
+
+    def load(batch_indices):
+        batch_images, batch_labels = tf.numpy_function(gather, [batch_indices], [tf.uint8, tf.int32])
+        batch_images.set_shape([None, height, width])
+        batch_labels.set_shape([None])
+        return tf.cast(batch_images[..., None], tf.float32) / 255.0, batch_labels
+
+    def expand(batch_images, batch_labels):
+        return tf.image.grayscale_to_rgb(batch_images), batch_labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    if augment:
+        seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True).batch(2)
+        dataset = tf.data.Dataset.zip((dataset, seeds)).map(
+            lambda batch, batch_seed: (random_affine(batch[0], batch_seed), batch[1]),
+            num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.map(expand, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
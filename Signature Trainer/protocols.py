@@ -0,0 +1,145 @@
+import base64
+import time
+import argparse
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+from cert_registry import OAEP_PADDING
+from challenges import ChallengeStore, VALID
+
+# Challenge-response modes, chosen per user from the key type in their certificate
+RSA_OAEP = 'rsa-oaep'  # Server encrypts the challenge, client decrypts it with the RSA private key
+ED25519 = 'ed25519'  # Client signs the challenge with an Ed25519 key, server verifies
+ECDSA = 'ecdsa-sha256'  # Client signs the challenge with an EC key, server verifies
+
+SIGNED_MESSAGE_PREFIX = b'signature-verification-login-v1\x00'
+
+ECDSA_ALGORITHM = ec.ECDSA(hashes.SHA256())
+
+
+def protocol_for(key):
+    """Returns the challenge-response mode for a public or private key."""
+    if isinstance(key, (rsa.RSAPublicKey, rsa.RSAPrivateKey)):
+        return RSA_OAEP
+    if isinstance(key, (ed25519.Ed25519PublicKey, ed25519.Ed25519PrivateKey)):
+        return ED25519
+    if isinstance(key, (ec.EllipticCurvePublicKey, ec.EllipticCurvePrivateKey)):
+        return ECDSA
+    raise ValueError(f"Unsupported key type: {type(key).__name__}")
+
+
+def signed_message(challenge_id, user, secret):
+    """
+    The bytes a client signs in the signature modes.
+
+    Binding the challenge id and user into the message means a signature cannot be
+    reused for another challenge or another account. The id and secret have fixed
+    lengths, so the concatenation is unambiguous.
+    """
+    return SIGNED_MESSAGE_PREFIX + challenge_id.encode() + secret + user.encode('utf-8')
+
+
+def server_payload(challenge, public_key):
+    """
+    Builds the base64 payload sent to the client for an issued challenge.
+
+    RSA users receive the challenge encrypted to their key; signature-mode users receive
+    the challenge itself, which is a public nonce in that protocol.
+    """
+    if protocol_for(public_key) == RSA_OAEP:
+        return base64.b64encode(public_key.encrypt(challenge.secret, OAEP_PADDING)).decode()
+    return base64.b64encode(challenge.secret).decode()
+
+
+def client_response(private_key, payload, challenge_id, user):
+    """Computes the client's response to a payload with its private key (the client side of the protocol)."""
+    data = base64.b64decode(payload)
+    mode = protocol_for(private_key)
+    if mode == RSA_OAEP:
+        return private_key.decrypt(data, OAEP_PADDING)
+    message = signed_message(challenge_id, user, data)
+    if mode == ED25519:
+        return private_key.sign(message)
+    return private_key.sign(message, ECDSA_ALGORITHM)
+
+
+def verify_response(store, challenge_id, user, public_key, response):
+    """
+    Verifies a client's response and consumes the challenge.
+
+    Returns:
+    str: One of the challenges module outcomes (VALID, UNKNOWN, EXPIRED, WRONG_USER, MISMATCH).
+    """
+    mode = protocol_for(public_key)
+    if mode == RSA_OAEP:
+        return store.verify(challenge_id, response, user)
+
+    def check(challenge, signature):
+        message = signed_message(challenge.challenge_id, challenge.user, challenge.secret)
+        try:
+            if mode == ED25519:
+                public_key.verify(signature, message)
+            else:
+                public_key.verify(signature, message, ECDSA_ALGORITHM)
+        except InvalidSignature:
+            return False
+        return True
+
+    return store.verify(challenge_id, response, user, check=check)
+
+
+def generate_key(mode, rsa_bits=2048):
+    if mode == RSA_OAEP:
+        return rsa.generate_private_key(public_exponent=65537, key_size=rsa_bits)
+    if mode == ED25519:
+        return ed25519.Ed25519PrivateKey.generate()
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def benchmark(logins=200, rsa_sizes=(2048, 3072)):
+    """
+    Runs complete logins (issue, server payload, client response, verify) for each mode.
+
+    Returns:
+    list: One dict per mode with per-login CPU milliseconds for the server and client
+          steps and the mean end-to-end latency.
+    """
+    cases = [(f'{RSA_OAEP}-{bits}', generate_key(RSA_OAEP, bits)) for bits in rsa_sizes]
+    cases += [(ED25519, generate_key(ED25519)), (f'{ECDSA}-p256', generate_key(ECDSA))]
+    results = []
+    for name, private_key in cases:
+        public_key = private_key.public_key()
+        store = ChallengeStore()
+        server_cpu = client_cpu = 0.0
+        started = time.perf_counter()
+        for _ in range(logins):
+            mark = time.process_time()
+            challenge = store.issue('bench')
+            payload = server_payload(challenge, public_key)
+            server_cpu += time.process_time() - mark
+
+            mark = time.process_time()
+            response = client_response(private_key, payload, challenge.challenge_id, 'bench')
+            client_cpu += time.process_time() - mark
+
+            mark = time.process_time()
+            if verify_response(store, challenge.challenge_id, 'bench', public_key, response) != VALID:
+                raise RuntimeError(f"{name} login failed during benchmark")
+            server_cpu += time.process_time() - mark
+        elapsed = time.perf_counter() - started
+        results.append({
+            'mode': name,
+            'server_cpu_ms': server_cpu / logins * 1000,
+            'client_cpu_ms': client_cpu / logins * 1000,
+            'latency_ms': elapsed / logins * 1000,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-login cost of the challenge-response modes.")
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+    print(f"{'mode':<20}{'server CPU ms':>15}{'client CPU ms':>15}{'latency ms':>12}")
+    for row in benchmark(args.logins):
+        print(f"{row['mode']:<20}{row['server_cpu_ms']:>15.3f}{row['client_cpu_ms']:>15.3f}{row['latency_ms']:>12.3f}")
@@ -1,8 +1,10 @@
 import os
-import cv2
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, simpledialog
 import subprocess  # Import subprocess module
+from dataset import CACHE_DIR_NAME
+from dataset_index import DatasetIndex
+from bulk_ingest import SHARD_DIR_NAME, ShardStore, ingest
 
 class SignatureTrainerApp:
     def __init__(self, master):
@@ -51,41 +53,38 @@ class SignatureTrainerApp:
         file_paths = filedialog.askopenfilenames(filetypes=[("PNG files", "*.png")])
         if not file_paths:
             return
+        person = simpledialog.askstring("Add Signatures", "Whose signatures are these?", parent=self.data_window)
+        if not person:
+            return
 
-        for file_path in file_paths:
-            new_dir = os.path.join(self.base_dir, type)
-            os.makedirs(new_dir, exist_ok=True)
-            new_file_name = os.path.basename(file_path)
-            new_file_path = os.path.join(new_dir, new_file_name)
-            os.rename(file_path, new_file_path)
-        messagebox.showinfo("Success", f"{len(file_paths)} {type} signatures added.")
+        # Files are validated and deduplicated, then moved into the person's folder and the shard store
+        store = ShardStore(os.path.join(self.base_dir, CACHE_DIR_NAME, SHARD_DIR_NAME))
+        stats = ingest(file_paths, store, person=person, label=0 if type == 'original' else 1,
+                       data_directory=self.base_dir, move=True)
+
+        # Keep the metadata index current so "Check Signature Data" does not need a rescan
+        index = DatasetIndex(self.base_dir)
+        index.add_files(stats['placed'])
+        index.close()
+        near_duplicates = "".join(f"\n{os.path.basename(path)} resembles {os.path.basename(matched)}"
+                                  for path, matched in stats['near_duplicate_files'])
+        messagebox.showinfo("Success", f"{len(stats['placed'])} {type} signatures added for {person}.\n"
+                                       f"Skipped: {stats['exact_duplicates']} duplicates, "
+                                       f"{stats['near_duplicates']} near-duplicates, {stats['invalid']} invalid images, "
+                                       f"{stats['skipped']} that could not be read or moved.{near_duplicates}")
 
     def confirm_signatures(self):
         messagebox.showinfo("Confirm", "Signatures confirmed and processed.")
 
     def check_signatures(self):
-        signatures, labels = self.load_signatures(self.base_dir)
-        genuine_count = labels.count(0)
-        forged_count = labels.count(1)
-        messagebox.showinfo("Signature Data Check", f"Total signatures: {len(signatures)}\nGenuine: {genuine_count}, Forged: {forged_count}")
-
-    def load_signatures(self, directory_path):
-        signatures = []
-        labels = []
-        for person_folder in os.listdir(directory_path):
-            person_path = os.path.join(directory_path, person_folder)
-            if os.path.isdir(person_path):
-                for filename in os.listdir(person_path):
-                    file_path = os.path.join(person_path, filename)
-                    image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
-                    if filename.startswith('original_'):
-                        labels.append(0)
-                    elif filename.startswith('forgeries_'):
-                        labels.append(1)
-                    else:
-                        continue
-                    signatures.append(image)
-        return signatures, labels
+        # Counts come from the metadata index; the refresh only stats files, nothing is decoded
+        index = DatasetIndex(self.base_dir)
+        index.refresh()
+        total, genuine_count, forged_count = index.counts()
+        per_person = "\n".join(f"{person}: Genuine {genuine}, Forged {forged}"
+                                for person, (genuine, forged) in index.person_counts().items())
+        index.close()
+        messagebox.showinfo("Signature Data Check", f"Total signatures: {total}\nGenuine: {genuine_count}, Forged: {forged_count}\n\n{per_person}")
 
     def on_close_data_window(self):
         self.data_window.destroy()
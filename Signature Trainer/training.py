@@ -0,0 +1,263 @@
+import os
+import json
+import shutil
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+from tensorflow.keras.callbacks import EarlyStopping, LambdaCallback
+from sklearn.model_selection import StratifiedKFold
+from dataset import update_cache, load_cached_signatures, load_cache_index
+from bulk_ingest import ShardStore
+from pipeline import make_dataset
+from metrics import histogram, timed, instrument_from_env
+
+NUM_FOLDS = 5
+EPOCHS = 5
+BATCH_SIZE = 32
+
+# Observed in the parent process from the timings each fold reports back
+FOLD_SECONDS = histogram('training_fold_seconds', "Time to train one cross-validation fold")
+EPOCH_SECONDS = histogram('training_epoch_seconds', "Time of one training epoch, validation included")
+
+
+# Simplified CNN model
+def create_model():
+    model = Sequential([
+        Conv2D(16, (3, 3), activation='relu', input_shape=(128, 128, 3)),
+        MaxPooling2D((2, 2)),
+        Dropout(0.25),
+        Conv2D(32, (3, 3), activation='relu'),
+        MaxPooling2D((2, 2)),
+        Dropout(0.25),
+        Flatten(),
+        Dense(64, activation='relu'),
+        Dropout(0.5),
+        Dense(2, activation='softmax')
+    ])
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+def manifest_path_for(model_path):
+    """Returns where the list of samples a model was trained on is kept, e.g. best_model_manifest.json."""
+    return os.path.splitext(model_path)[0] + '_manifest.json'
+
+
+def save_manifest(model_path, entries):
+    """Records the cache entries (path, mtime_ns, size) a model has been trained on."""
+    keys = sorted({(e['path'], e['mtime_ns'], e['size']) for e in entries})
+    temp_path = manifest_path_for(model_path) + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'entries': keys}, f)
+    os.replace(temp_path, manifest_path_for(model_path))
+
+
+def load_manifest(model_path):
+    """Returns the set of (path, mtime_ns, size) a model was trained on, or None if unknown."""
+    try:
+        with open(manifest_path_for(model_path)) as f:
+            return {tuple(key) for key in json.load(f)['entries']}
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def training_entries(data_directory, shard_directory=None):
+    """
+    Returns the per-image entries (path, mtime_ns, size, label) of the training set, in row order.
+
+    The set is the bulk-ingested shards in `shard_directory` if given, otherwise the data
+    directory's cache, which is not refreshed here.
+    """
+    return ShardStore(shard_directory).index() if shard_directory else load_cache_index(data_directory)
+
+
+def load_training_set(data_directory, shard_directory=None):
+    """
+    Loads the training set chosen as in training_entries.
+
+    Returns:
+    np.ndarray: uint8 grayscale images (N, height, width), memory-mapped when read from the cache.
+    np.ndarray: uint8 labels, 0 for genuine and 1 for forged.
+    """
+    if shard_directory:
+        images, labels, _ = ShardStore(shard_directory).load()
+        return images, labels
+    return load_cached_signatures(data_directory, update=False)
+
+
+def limit_tensorflow_threads(threads):
+    """Caps TensorFlow's CPU thread pools; must run before TensorFlow executes anything."""
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, min(2, threads)))
+
+
+def fold_summary(fold_no, history, model_path, train_seconds=None, epoch_seconds=()):
+    """Reduces a fold's Keras history to the metrics at its best (lowest val_loss) epoch."""
+    best_epoch = int(np.argmin(history['val_loss']))
+    return {
+        'fold': fold_no,
+        'model_path': model_path,
+        'history': history,
+        'best_epoch': best_epoch + 1,
+        'val_loss': float(history['val_loss'][best_epoch]),
+        'val_accuracy': float(history['val_accuracy'][best_epoch]),
+        'train_seconds': train_seconds,
+        'epoch_seconds': list(epoch_seconds),
+    }
+
+
+def train_fold(data_directory, fold_no, train_idx, val_idx, epochs=EPOCHS, batch_size=BATCH_SIZE,
+               seed=None, output_dir='.', shard_directory=None):
+    """
+    Trains and saves one cross-validation fold.
+
+    Pixels are read from the memory-mapped cache, so worker processes share the page
+    cache instead of each receiving a pickled copy of the dataset. Shards, when used,
+    are read by each worker with one sequential read per shard.
+
+    Returns:
+    dict: The fold summary (see fold_summary).
+    """
+    fold_seed = None if seed is None else seed + fold_no
+    if fold_seed is not None:
+        tf.keras.utils.set_random_seed(fold_seed)
+
+    all_images, all_labels = load_training_set(data_directory, shard_directory)
+    model = create_model()
+    train_ds = make_dataset(all_images, all_labels, train_idx, batch_size=batch_size,
+                            augment=True, shuffle=True, seed=fold_seed)
+    val_ds = make_dataset(all_images, all_labels, val_idx, batch_size=batch_size)
+
+    early_stopping = EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
+    epoch_started, epoch_seconds = [], []
+    epoch_timer = LambdaCallback(
+        on_epoch_begin=lambda epoch, logs: epoch_started.append(time.perf_counter()),
+        on_epoch_end=lambda epoch, logs: epoch_seconds.append(time.perf_counter() - epoch_started[-1]))
+    started = time.perf_counter()
+    history = model.fit(train_ds, epochs=epochs, validation_data=val_ds,
+                        callbacks=[early_stopping, epoch_timer], verbose=2)
+    train_seconds = time.perf_counter() - started
+
+    model_path = os.path.join(output_dir, f'best_model_fold_{fold_no}.h5')
+    model.save(model_path)
+    return fold_summary(fold_no, history.history, model_path, train_seconds, epoch_seconds)
+
+
+def _record_fold_timings(summary):
+    if summary.get('train_seconds') is not None:
+        FOLD_SECONDS.observe(summary['train_seconds'])
+    for seconds in summary.get('epoch_seconds', ()):
+        EPOCH_SECONDS.observe(seconds)
+
+
+@timed('training_run_folds_seconds', "Time of a complete cross-validation run")
+def run_folds(data_directory, num_folds=NUM_FOLDS, epochs=EPOCHS, batch_size=BATCH_SIZE, workers=None,
+              threads_per_worker=None, seed=None, output_dir='.', on_fold_done=None, shard_directory=None):
+    """
+    Runs stratified k-fold cross-validation with the folds trained concurrently.
+
+    Each fold runs in its own process with TensorFlow limited to `threads_per_worker`
+    CPU threads, so the small CNN can keep a many-core machine busy. With workers=1 the
+    folds run one after another in the current process.
+
+    Args:
+    data_directory (str): The data directory (its cache is refreshed once, up front); unused with shards.
+    num_folds (int): Number of StratifiedKFold splits.
+    epochs (int): Maximum epochs per fold.
+    batch_size (int): Training batch size.
+    workers (int): Concurrent fold processes; defaults to min(num_folds, CPU count).
+    threads_per_worker (int): TensorFlow CPU threads per process; defaults to an even share of the CPUs.
+    seed (int): Fixes the fold split, weight initialisation and augmentation for reproducible runs.
+    output_dir (str): Where best_model_fold_N.h5 and best_model.h5 are written.
+    on_fold_done (callable): Called with each fold summary as soon as that fold finishes.
+    shard_directory (str): Train on the bulk-ingested shards there instead of the data directory.
+
+    Returns:
+    dict: 'folds' (summaries in fold order), 'mean_val_accuracy', 'std_val_accuracy',
+          'mean_val_loss', 'best_fold' and 'best_model_path'.
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or min(num_folds, cpus)
+    threads_per_worker = threads_per_worker or max(1, cpus // workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if not shard_directory:
+        update_cache(data_directory)
+    entries = training_entries(data_directory, shard_directory)
+    all_labels = np.array([entry['label'] for entry in entries], dtype=np.uint8)
+    kfold = StratifiedKFold(n_splits=num_folds, shuffle=True, random_state=seed)
+    splits = list(kfold.split(np.zeros(len(all_labels)), all_labels))
+
+    folds = []
+    if workers == 1:
+        for fold_no, (train_idx, val_idx) in enumerate(splits, start=1):
+            summary = train_fold(data_directory, fold_no, train_idx, val_idx, epochs, batch_size, seed, output_dir,
+                                 shard_directory)
+            _record_fold_timings(summary)
+            folds.append(summary)
+            if on_fold_done:
+                on_fold_done(summary)
+    else:
+        # 'spawn' gives every worker a fresh TensorFlow runtime; forking one is not safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=limit_tensorflow_threads, initargs=(threads_per_worker,)) as executor:
+            futures = [
+                executor.submit(train_fold, data_directory, fold_no, train_idx, val_idx,
+                                epochs, batch_size, seed, output_dir, shard_directory)
+                for fold_no, (train_idx, val_idx) in enumerate(splits, start=1)
+            ]
+            for future in as_completed(futures):
+                summary = future.result()
+                _record_fold_timings(summary)
+                folds.append(summary)
+                if on_fold_done:
+                    on_fold_done(summary)
+    folds.sort(key=lambda summary: summary['fold'])
+
+    val_accuracy = np.array([summary['val_accuracy'] for summary in folds])
+    best = min(folds, key=lambda summary: summary['val_loss'])
+    best_model_path = os.path.join(output_dir, 'best_model.h5')
+    shutil.copyfile(best['model_path'], best_model_path)
+    save_manifest(best_model_path, entries)
+    return {
+        'folds': folds,
+        'mean_val_accuracy': float(val_accuracy.mean()),
+        'std_val_accuracy': float(val_accuracy.std()),
+        'mean_val_loss': float(np.mean([summary['val_loss'] for summary in folds])),
+        'best_fold': best['fold'],
+        'best_model_path': best_model_path,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the signature CNN with parallel cross-validation folds.")
+    parser.add_argument('data_directory', nargs='?', default='Data')
+    parser.add_argument('--folds', type=int, default=NUM_FOLDS)
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, help="Concurrent fold processes")
+    parser.add_argument('--threads-per-worker', type=int, help="TensorFlow CPU threads per process")
+    parser.add_argument('--seed', type=int, help="Seed for reproducible splits and training")
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--shards', help="Shard directory to train on instead of the data directory")
+    args = parser.parse_args(argv)
+    instrument_from_env()
+
+    result = run_folds(args.data_directory, args.folds, args.epochs, args.batch_size, args.workers,
+                       args.threads_per_worker, args.seed, args.output_dir,
+                       on_fold_done=lambda s: print(f"Fold {s['fold']} done: val_loss={s['val_loss']:.4f}, "
+                                                    f"val_accuracy={s['val_accuracy']:.4f}"),
+                       shard_directory=args.shards)
+    print(f"Mean val_accuracy: {result['mean_val_accuracy']:.4f} (+/- {result['std_val_accuracy']:.4f}), "
+          f"mean val_loss: {result['mean_val_loss']:.4f}")
+    print(f"Best fold: {result['best_fold']}, saved as {result['best_model_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
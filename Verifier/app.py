@@ -1,36 +1,48 @@
 import os
-import shutil
-import cv2
-import numpy as np
-from tensorflow.keras.models import load_model
+import threading
 from tkinter import filedialog, messagebox, Button, Label, Tk
 from tkinter import ttk
+from inference import verify_sources, verify_files
+from model_loader import ModelLoader, model_file_for
+from result_cache import ResultCache
+from audit import configure_audit_log
+from metrics import timed, instrument_from_env
 
 
-# Load the pre-trained model
-model = load_model('best_model.h5')
+# Every verdict is recorded as a JSON line by a background writer
+configure_audit_log('verifier_audit.log')
 
+# Metrics export and profiling are opt-in through the SIGNATURE_* environment variables
+instrument_from_env()
 
-def load_and_predict_image(filepath):
-    # Create a temporary file path
-    temp_path = 'temp_' + os.path.basename(filepath)
+MODEL_PATH = 'best_model.h5'
+# 'float32' runs the Keras model; 'float16' or 'int8' run its quantized export (see quantize.py)
+BACKEND = 'float32'
 
-    # Copy the original file to the temporary file
-    shutil.copy(filepath, temp_path)
+# The pre-trained model is loaded on first use (or in the background once the window is up)
+model_loader = ModelLoader(MODEL_PATH, backend=BACKEND)
 
-    # Process the temporary file
-    img = cv2.imread(temp_path, cv2.IMREAD_COLOR)
-    img = cv2.resize(img, (224, 224))
-    if img.shape[2] == 1:  # Convert grayscale to RGB if needed
-        img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-    img = img / 255.0
-    img = img.reshape(1, 224, 224, 3)
-    prediction = model.predict(img)
+# Re-submitted scans are answered from their content hash instead of running the model again.
+# The cache is created on the first verification, since versioning it hashes the model file.
+result_cache = None
+result_cache_lock = threading.Lock()
 
-    # Delete the temporary file after processing
-    os.remove(temp_path)
 
-    return "Genuine" if prediction[0][0] >= 0.83 else "Forged"
+def get_result_cache():
+    global result_cache
+    with result_cache_lock:
+        if result_cache is None:
+            try:
+                result_cache = ResultCache.for_model(model_file_for(MODEL_PATH, BACKEND))
+            except OSError:
+                return None  # Only the exported artifact exists, so there is no file to version results by
+        return result_cache
+
+
+@timed('verifier_load_and_predict_seconds', "Time to verify one image end to end")
+def load_and_predict_image(source):
+    # Accepts a file path or encoded image bytes; nothing is copied to disk
+    return verify_sources(model_loader.get(), [source], [source], cache=get_result_cache())[0].verdict
 
 
 def predict_images():
@@ -38,13 +50,11 @@ def predict_images():
     if not filepaths:
         return
 
-    results = []
-    for filepath in filepaths:
-        result = load_and_predict_image(filepath)
-        results.append((os.path.basename(filepath), result))
+    # Verify all selected files in batches rather than one model call per file
+    results = verify_files(model_loader.get(), list(filepaths), cache=get_result_cache())
 
     # Display the results
-    result_text = "\n".join([f"{name}: {res}" for name, res in results])
+    result_text = "\n".join([f"{os.path.basename(res.filepath)}: {res.verdict}" for res in results])
     messagebox.showinfo("Prediction Results", result_text)
 
 
@@ -78,4 +88,7 @@ button_load.pack(pady=10, fill='x', expand=True)
 status_label = ttk.Label(frame, text="", background="#f0f0f0")
 status_label.pack(pady=(20, 0), fill='x')
 
+# Start loading and warming up the model while the user picks files
+model_loader.preload()
+
 root.mainloop()
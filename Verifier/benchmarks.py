@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import datetime
+import numpy as np
+import cv2
+import shared  # noqa: F401  Makes the Signature Trainer modules importable
+
+SUITES = ('dataset', 'training', 'verifier', 'auth')
+PERSONS = 10
+PER_PERSON = 24  # Genuine and forged signatures each, as the trainer UI allows per type
+IMAGE_SIZE = (220, 155)  # (width, height) of the generated scans
+EPOCHS = 3
+LOGINS = 200
+SINGLE_REQUESTS = 100
+TOLERANCE = 0.2  # Relative change beyond which a metric counts as a regression
+REPEATS = 3  # Cheap measurements keep their fastest run, which is the least noisy
+
+# Metric name suffix -> whether a larger value is better; other metrics are informational
+METRIC_DIRECTIONS = (('_per_second', True), ('_ms', False), ('_seconds', False))
+
+
+def make_synthetic_data(directory, persons=PERSONS, per_person=PER_PERSON, size=IMAGE_SIZE, seed=0):
+    """
+    Writes a Data tree of synthetic signatures: <directory>/person<N>/original_<i>.png and forgeries_<i>.png.
+
+    Each person has a random base stroke; genuine samples jitter it slightly, forgeries
+    distort it more and vary the pen width, so the classes are learnable but not trivial.
+
+    Returns:
+    int: Number of files written.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    written = 0
+    for person in range(persons):
+        person_dir = os.path.join(directory, f"person{person}")
+        os.makedirs(person_dir, exist_ok=True)
+        xs = np.linspace(10, width - 10, 12)
+        base = rng.uniform(0.25, 0.75, len(xs)) * height
+        for prefix, jitter, widths in (('original', 3.0, (2, 2)), ('forgeries', 12.0, (1, 4))):
+            for i in range(per_person):
+                image = np.full((height, width), 255, dtype=np.uint8)
+                ys = np.clip(base + rng.normal(0, jitter, len(xs)), 5, height - 5)
+                points = np.stack([xs + rng.normal(0, jitter / 2, len(xs)), ys], axis=1).astype(np.int32)
+                cv2.polylines(image, [points], False, 0, int(rng.integers(widths[0], widths[1] + 1)), cv2.LINE_AA)
+                cv2.imwrite(os.path.join(person_dir, f"{prefix}_{i}.png"), image)
+                written += 1
+    return written
+
+
+def make_throwaway_ca(directory, rsa_users=2, ec_users=2):
+    """
+    Creates a CA and user certificates signed by it, with the users' private keys beside them.
+
+    Returns:
+    list: (user, certificate path, private key path) for every user.
+    """
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa, ec
+
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ca_key = ec.generate_private_key(ec.SECP256R1())
+    ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Benchmark CA")])
+
+    users = []
+    kinds = [('RSA', lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048))] * rsa_users
+    kinds += [('EC', lambda: ec.generate_private_key(ec.SECP256R1()))] * ec_users
+    for i, (kind, generate) in enumerate(kinds):
+        user = f"{kind} User {i + 1}"
+        key = generate()
+        certificate = (x509.CertificateBuilder()
+                       .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, user)]))
+                       .issuer_name(ca_name)
+                       .public_key(key.public_key())
+                       .serial_number(x509.random_serial_number())
+                       .not_valid_before(now)
+                       .not_valid_after(now + datetime.timedelta(days=1))
+                       .sign(ca_key, hashes.SHA256()))
+        stem = user.lower().replace(' ', '_')
+        cert_path = os.path.join(directory, f"{stem}_certificate.pem")
+        key_path = os.path.join(directory, f"{stem}_private_key.pem")
+        with open(cert_path, 'wb') as f:
+            f.write(certificate.public_bytes(serialization.Encoding.PEM))
+        with open(key_path, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        users.append((user, cert_path, key_path))
+    return users
+
+
+def best_of(work, repeats=REPEATS):
+    """Returns the fastest of `repeats` timed calls of `work` in seconds, and its last result."""
+    fastest, result = float('inf'), None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = work()
+        fastest = min(fastest, time.perf_counter() - started)
+    return fastest, result
+
+
+def bench_dataset(data_directory):
+    """
+    Throughput of loading the Data tree from PNGs, expanding it to RGB (separately, and in one
+    pass with the preallocated parallel loader) and building the cache.
+    """
+    from dataset import CACHE_DIR_NAME, load_signatures, load_signatures_rgb, to_rgb, update_cache
+
+    # A kept --workdir still holds the previous run's cache, which would turn the cold build into a refresh
+    shutil.rmtree(os.path.join(data_directory, CACHE_DIR_NAME), ignore_errors=True)
+    load_seconds, (images, _) = best_of(lambda: load_signatures(data_directory))
+    rgb_seconds, _ = best_of(lambda: to_rgb(images))
+    direct_rgb_seconds, _ = best_of(lambda: load_signatures_rgb(data_directory))
+    cold_seconds, _ = best_of(lambda: update_cache(data_directory), repeats=1)  # Only the first build is cold
+    warm_seconds, _ = best_of(lambda: update_cache(data_directory))
+    return {
+        'images': len(images),
+        'load_signatures_per_second': len(images) / load_seconds,
+        'to_rgb_per_second': len(images) / rgb_seconds,
+        'load_signatures_rgb_per_second': len(images) / direct_rgb_seconds,
+        'cache_build_per_second': len(images) / cold_seconds,
+        'cache_refresh_ms': warm_seconds * 1000.0,
+    }
+
+
+def bench_training(data_directory, epochs=EPOCHS, model_path=None, seed=0):
+    """Epoch time of the training pipeline over the whole Data tree; optionally saves the model."""
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import LambdaCallback
+    from dataset import load_cached_signatures
+    from pipeline import make_dataset
+    from training import BATCH_SIZE, create_model
+
+    tf.keras.utils.set_random_seed(seed)
+    images, labels = load_cached_signatures(data_directory)
+    dataset = make_dataset(images, labels, np.arange(len(labels)), batch_size=BATCH_SIZE,
+                           augment=True, shuffle=True, seed=seed)
+    model = create_model()
+    started, durations = [], []
+    timer = LambdaCallback(on_epoch_begin=lambda epoch, logs: started.append(time.perf_counter()),
+                           on_epoch_end=lambda epoch, logs: durations.append(time.perf_counter() - started[-1]))
+    model.fit(dataset, epochs=epochs, callbacks=[timer], verbose=0)
+    if model_path:
+        model.save(model_path)
+    steady = durations[1:] or durations
+    return {
+        'images': len(labels),
+        'first_epoch_seconds': durations[0],
+        'epoch_seconds': float(np.mean(steady)),
+        'train_images_per_second': len(labels) / float(np.mean(steady)),
+    }
+
+
+def bench_verifier(model_path, data_directory, requests=SINGLE_REQUESTS):
+    """Single-image latency and batched throughput of verify_sources on the Data tree's files."""
+    from dataset import scan_signatures
+    from inference import verify_files
+    from model_loader import load_inference_model, warm_up
+
+    model = load_inference_model(model_path, prefer_artifact=False)
+    warm_up(model)
+    file_paths = [path for path, _, _ in scan_signatures(data_directory)]
+
+    latencies = []
+    for i in range(requests):
+        started = time.perf_counter()
+        verify_files(model, [file_paths[i % len(file_paths)]])
+        latencies.append(time.perf_counter() - started)
+    latencies = np.array(latencies) * 1000.0
+
+    started = time.perf_counter()
+    verify_files(model, file_paths, batch_size=32)
+    batched_seconds = time.perf_counter() - started
+    return {
+        'single_p50_ms': float(np.percentile(latencies, 50)),
+        'single_p95_ms': float(np.percentile(latencies, 95)),
+        'single_per_second': requests / (latencies.sum() / 1000.0),
+        'batched_per_second': len(file_paths) / batched_seconds,
+    }
+
+
+def bench_auth(ca_directory, users, logins=LOGINS, audit_path=None):
+    """
+    Challenge issue rate, and full login rates per key type through the same LoginServer the
+    login GUI uses: certificate registry, lockout check, payload, client response, verification
+    and audit records. With `audit_path` the records are really written, as in the application.
+    """
+    import logging
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+    from audit import AUDIT_LOGGER, configure_audit_log
+    from cert_registry import CertificateRegistry
+    from challenges import ChallengeStore, VALID
+    from lockout import Throttle
+    from login import LoginServer
+    from protocols import protocol_for, client_response
+
+    registry = CertificateRegistry(ca_directory)
+    store = ChallengeStore()
+
+    def issue_and_consume():
+        for i in range(logins * 50):
+            store.consume(store.issue(users[i % len(users)][0]).challenge_id)
+    issue_seconds, _ = best_of(issue_and_consume)
+    results = {'challenge_issue_per_second': logins * 50 / issue_seconds}
+
+    audit_logger = logging.getLogger(AUDIT_LOGGER)
+    handlers_before = len(audit_logger.handlers)
+    writer = configure_audit_log(audit_path) if audit_path else None
+    # A burst allowance covering every login of every mode from the one client, so the rate
+    # limiter is consulted but never refuses
+    server = LoginServer(registry, store, Throttle(capacity=logins * len(users) + 1))
+    try:
+        by_mode = {}
+        for user, _, key_path in users:
+            with open(key_path, 'rb') as f:
+                by_mode.setdefault(protocol_for(registry.get(user).public_key), (user, load_pem_private_key(f.read(), None)))
+        for mode, (user, private_key) in sorted(by_mode.items()):
+            started = time.perf_counter()
+            for _ in range(logins):
+                challenge, payload, _ = server.issue(user)
+                status, _ = server.begin_attempt(user, challenge.challenge_id, 'benchmark')
+                if status == VALID:
+                    response = client_response(private_key, payload, challenge.challenge_id, user)
+                    status = server.finish(user, challenge.challenge_id, response, 'benchmark')
+                if status != VALID:
+                    raise RuntimeError(f"{mode} login failed during benchmark: {status}")
+            elapsed = time.perf_counter() - started
+            results[f"{mode}_login_per_second"] = logins / elapsed
+            results[f"{mode}_login_ms"] = elapsed / logins * 1000.0
+    finally:
+        if writer is not None:
+            writer.stop()
+            for handler in audit_logger.handlers[handlers_before:]:
+                audit_logger.removeHandler(handler)
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compares every directional metric with a baseline run.
+
+    Returns:
+    list: (suite, metric, baseline, current, relative change, regressed) for metrics present in both.
+    """
+    rows = []
+    for suite, metrics in results['results'].items():
+        for metric, current in metrics.items():
+            previous = baseline.get('results', {}).get(suite, {}).get(metric)
+            higher_is_better = next((better for suffix, better in METRIC_DIRECTIONS if metric.endswith(suffix)), None)
+            if previous is None or higher_is_better is None or not previous:
+                continue
+            change = (current - previous) / previous
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            rows.append((suite, metric, previous, current, change, regressed))
+    return rows
+
+
+def run(suites=SUITES, persons=PERSONS, per_person=PER_PERSON, epochs=EPOCHS, logins=LOGINS, workdir=None):
+    """Runs the selected suites in a scratch directory and returns the results document."""
+    cleanup = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='signature-bench-')
+    data_directory = os.path.join(workdir, 'Data')
+    model_path = os.path.join(workdir, 'best_model.h5')
+    results = {}
+    try:
+        if not os.path.isdir(data_directory):
+            make_synthetic_data(data_directory, persons, per_person)
+        if 'dataset' in suites:
+            results['dataset'] = bench_dataset(data_directory)
+        if 'training' in suites or 'verifier' in suites:
+            results['training'] = bench_training(data_directory, epochs, model_path)
+        if 'verifier' in suites:
+            results['verifier'] = bench_verifier(model_path, data_directory)
+        if 'auth' in suites:
+            ca_directory = os.path.join(workdir, 'CA')
+            results['auth'] = bench_auth(ca_directory, make_throwaway_ca(ca_directory), logins,
+                                         os.path.join(workdir, 'audit.log'))
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        import tensorflow as tf
+        tensorflow_version = tf.__version__
+    except ImportError:
+        tensorflow_version = None
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'tensorflow': tensorflow_version,
+            'opencv': cv2.__version__,
+            'config': {'persons': persons, 'per_person': per_person, 'epochs': epochs, 'logins': logins},
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark data loading, training, verification and login on synthetic data.")
+    parser.add_argument('--suites', default=','.join(SUITES), help=f"Comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument('--persons', type=int, default=PERSONS)
+    parser.add_argument('--per-person', type=int, default=PER_PERSON, help="Genuine and forged signatures each")
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--logins', type=int, default=LOGINS)
+    parser.add_argument('--workdir', help="Keep the generated data here instead of a temporary directory")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="Earlier results to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="Relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    suites = [suite.strip() for suite in args.suites.split(',') if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+    results = run(suites, args.persons, args.per_person, args.epochs, args.logins, args.workdir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for suite, metrics in results['results'].items():
+        for metric, value in metrics.items():
+            print(f"{suite:<10}{metric:<32}{value:>14.3f}")
+    print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = 0
+    print(f"\n{'suite':<10}{'metric':<32}{'baseline':>14}{'current':>14}{'change':>9}")
+    for suite, metric, previous, current, change, regressed in compare(results, baseline, args.tolerance):
+        regressions += regressed
+        print(f"{suite:<10}{metric:<32}{previous:>14.3f}{current:>14.3f}{change:>+9.1%}{'  REGRESSION' if regressed else ''}")
+    if regressions:
+        print(f"{regressions} metrics regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
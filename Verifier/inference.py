@@ -0,0 +1,178 @@
+import os
+import sys
+import argparse
+from collections import namedtuple
+import numpy as np
+import shared  # noqa: F401  Makes the Signature Trainer modules importable
+from audit import audit_event, configure_audit_log
+from metrics import counter, histogram, instrument_from_env
+from ingest import decode_image, Preprocessor
+from model_loader import BACKENDS, FLOAT32, ModelLoader, model_file_for
+from result_cache import ResultCache, read_source, image_key
+
+# Score at or above which a signature is reported as genuine
+THRESHOLD = 0.83
+DEFAULT_BATCH_SIZE = 32
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# One entry per verified file; score is None when the image could not be decoded
+VerificationResult = namedtuple('VerificationResult', ['filepath', 'score', 'verdict'])
+
+# Per-stage latency of the verification hot path
+DECODE_SECONDS = histogram('verifier_decode_seconds', "Time to decode one image")
+PREPROCESS_SECONDS = histogram('verifier_preprocess_seconds', "Time to resize and scale one image into the batch")
+PREDICT_SECONDS = histogram('verifier_predict_seconds', "Time of one model call on a batch")
+VERIFY_SECONDS = histogram('verifier_verify_seconds', "Time of one verify_sources call")
+IMAGES_TOTAL = counter('verifier_images_total', "Images submitted for verification")
+UNREADABLE_TOTAL = counter('verifier_unreadable_total', "Images that could not be decoded")
+GENUINE_TOTAL = counter('verifier_genuine_total', "Images verified as genuine")
+FORGED_TOTAL = counter('verifier_forged_total', "Images verified as forged")
+
+
+def model_input_size(model):
+    """Returns the (width, height) the model expects, as used by cv2.resize."""
+    _, height, width, _ = model.input_shape
+    return width, height
+
+
+def verdict_for(score, threshold=THRESHOLD):
+    return "Genuine" if score >= threshold else "Forged"
+
+
+def collect_image_paths(inputs):
+    """Expands directories into the image files they contain, keeping the given order."""
+    filepaths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    filepaths.append(os.path.join(path, filename))
+        else:
+            filepaths.append(path)
+    return filepaths
+
+
+def verify_sources(model, sources, names, batch_size=DEFAULT_BATCH_SIZE, threshold=THRESHOLD, cache=None):
+    """
+    Verifies signature images given as file paths or in-memory encoded bytes.
+
+    Images are decoded straight from their source and preprocessed into a single
+    preallocated float32 batch tensor which is reused for every chunk of `batch_size`
+    images, so memory stays bounded however many images are submitted.
+
+    Args:
+    model: Loaded Keras model.
+    sources (list): File paths or encoded image bytes.
+    names (list): The label reported for each source in the results.
+    batch_size (int): Number of images passed to the model per call.
+    threshold (float): Genuine score threshold.
+    cache (ResultCache): Optional; images already scored by this model version skip decoding and the model.
+
+    Returns:
+    list: A VerificationResult for each source, in input order.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    with VERIFY_SECONDS.time():
+        width, height = model_input_size(model)
+        batch = np.empty((min(batch_size, max(len(sources), 1)), height, width, 3), dtype=np.float32)
+        preprocess = Preprocessor(width, height)
+
+        results = []
+        for start in range(0, len(sources), batch_size):
+            chunk = range(start, min(start + batch_size, len(sources)))
+            slots = []  # Index into the batch tensor for each image, None if undecodable
+            keys = {}  # Cache key of each image the model scores
+            cached = {}  # Score of each image answered by the cache
+            filled = 0
+            for i in chunk:
+                source = sources[i]
+                if cache is not None:
+                    source = read_source(source)  # Hash and decode the same bytes
+                    if source is not None:
+                        key = image_key(source)
+                        score = cache.get(key)
+                        if score is not None:
+                            cached[i] = score
+                            slots.append(None)
+                            continue
+                        keys[filled] = key
+                with DECODE_SECONDS.time():
+                    img = decode_image(source) if source is not None else None
+                if img is None:
+                    keys.pop(filled, None)
+                    slots.append(None)
+                    continue
+                with PREPROCESS_SECONDS.time():
+                    preprocess(img, batch[filled])
+                slots.append(filled)
+                filled += 1
+
+            predictions = None
+            if filled:
+                with PREDICT_SECONDS.time():
+                    predictions = np.asarray(model.predict_on_batch(batch[:filled]))
+            scored = []
+            for i, slot in zip(chunk, slots):
+                if i in cached:
+                    score = cached[i]
+                elif slot is None:
+                    score = None
+                else:
+                    score = float(predictions[slot][0])
+                    if slot in keys:
+                        scored.append((keys[slot], score))
+                if score is None:
+                    result = VerificationResult(names[i], None, "Unreadable")
+                    UNREADABLE_TOTAL.inc()
+                else:
+                    result = VerificationResult(names[i], score, verdict_for(score, threshold))
+                    (GENUINE_TOTAL if result.verdict == "Genuine" else FORGED_TOTAL).inc()
+                results.append(result)
+                audit_event('verifier_verdict', source=result.filepath if isinstance(result.filepath, str) else None,
+                            score=result.score, verdict=result.verdict)
+            if scored:
+                cache.put_many(scored)
+        IMAGES_TOTAL.inc(len(sources))
+    return results
+
+
+def verify_files(model, filepaths, batch_size=DEFAULT_BATCH_SIZE, threshold=THRESHOLD, cache=None):
+    """Verifies a list of image files; see verify_sources."""
+    return verify_sources(model, filepaths, filepaths, batch_size, threshold, cache)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify signature images without the GUI.")
+    parser.add_argument('inputs', nargs='+', help="Image files or directories of images")
+    parser.add_argument('--model', default='best_model.h5', help="Path to the trained model")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--audit-log', help="Also record every verdict as JSON lines in this file")
+    parser.add_argument('--backend', choices=BACKENDS, default=FLOAT32,
+                        help="Quantized backends must first be exported with quantize.py")
+    parser.add_argument('--cache-db', help="SQLite file caching scores across runs, keyed by image content and model version")
+    args = parser.parse_args(argv)
+
+    if args.audit_log:
+        configure_audit_log(args.audit_log)
+    instrument_from_env()
+
+    model = ModelLoader(args.model, backend=args.backend).get()
+    cache = None
+    if args.cache_db:
+        cache = ResultCache.for_model(model_file_for(args.model, args.backend), disk_path=args.cache_db)
+
+    results = verify_files(model, collect_image_paths(args.inputs), args.batch_size, args.threshold, cache)
+    for result in results:
+        score = "-" if result.score is None else f"{result.score:.4f}"
+        print(f"{result.filepath}\t{score}\t{result.verdict}")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses", file=sys.stderr)
+        cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,77 @@
+import os
+import cv2
+import numpy as np
+
+
+def decode_bytes(data, flags=cv2.IMREAD_COLOR):
+    """
+    Decodes an encoded image (PNG/JPEG) held in memory.
+
+    Args:
+    data (bytes, bytearray, memoryview or np.ndarray): The encoded image bytes.
+    flags (int): cv2.imdecode flags.
+
+    Returns:
+    np.ndarray: The decoded uint8 image, or None if the bytes are not a valid image.
+    """
+    buffer = data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, flags)
+
+
+def decode_file(filepath, flags=cv2.IMREAD_COLOR):
+    """
+    Decodes an image file by memory-mapping it, without copying it anywhere first.
+
+    Returns:
+    np.ndarray: The decoded uint8 image, or None if the file is missing, empty or not an image.
+    """
+    try:
+        if os.path.getsize(filepath) == 0:
+            return None
+        mapped = np.memmap(filepath, dtype=np.uint8, mode='r')
+    except (OSError, ValueError):
+        return None
+    try:
+        return cv2.imdecode(mapped, flags)
+    finally:
+        del mapped  # Release the mapping so the file is not held open
+
+
+def decode_image(source, flags=cv2.IMREAD_COLOR):
+    """Decodes a file path or an in-memory encoded image, whichever is given."""
+    if isinstance(source, (str, os.PathLike)):
+        return decode_file(source, flags)
+    return decode_bytes(source, flags)
+
+
+class Preprocessor:
+    """
+    Resizes decoded images and scales them to float32 in [0, 1] using reusable buffers.
+
+    The only per-image work is the resize and the scaling, both of which write into
+    buffers owned by the preprocessor or the caller, so no arrays are allocated per image.
+    An instance is not thread-safe; use one per thread.
+    """
+
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.resized_gray = np.empty((height, width), dtype=np.uint8)
+
+    def __call__(self, img, out):
+        """
+        Writes the preprocessed image into `out`.
+
+        Args:
+        img (np.ndarray): Decoded uint8 image, grayscale or 3-channel.
+        out (np.ndarray): float32 array of shape (height, width, 3), e.g. one slot of a batch.
+        """
+        if img.ndim == 2:  # Convert grayscale to RGB if needed
+            cv2.resize(img, self.size, dst=self.resized_gray)
+            cv2.cvtColor(self.resized_gray, cv2.COLOR_GRAY2RGB, dst=self.resized)
+        else:
+            cv2.resize(img, self.size, dst=self.resized)
+        np.multiply(self.resized, np.float32(1.0 / 255.0), out=out, casting='unsafe')
+        return out
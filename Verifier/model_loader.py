@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+import threading
+import time
+import numpy as np
+
+DEFAULT_MODEL_PATH = 'best_model.h5'
+
+# Inference backends: the Keras/SavedModel float32 model, or a quantized TFLite export of it (see quantize.py)
+FLOAT32 = 'float32'
+FLOAT16 = 'float16'  # Weights stored as float16; about half the size, near-identical scores
+INT8 = 'int8'  # Weights and activations quantized to int8 using calibration images
+BACKENDS = (FLOAT32, FLOAT16, INT8)
+QUANTIZED_BACKENDS = (FLOAT16, INT8)
+
+
+def artifact_path_for(model_path):
+    """Returns where the exported inference artifact for a .h5 model lives."""
+    return os.path.splitext(model_path)[0] + '_inference'
+
+
+def artifact_is_current(model_path, artifact_path):
+    """True if the artifact exists and is not older than the model it was exported from."""
+    saved_model = os.path.join(artifact_path, 'saved_model.pb')
+    if not os.path.exists(saved_model):
+        return False
+    if not os.path.exists(model_path):
+        return True
+    return os.path.getmtime(saved_model) >= os.path.getmtime(model_path)
+
+
+def tflite_path_for(model_path, backend):
+    """Returns where the quantized TFLite export of a .h5 model lives, e.g. best_model_int8.tflite."""
+    return f"{os.path.splitext(model_path)[0]}_{backend}.tflite"
+
+
+def tflite_is_current(model_path, tflite_path):
+    """True if the quantized export exists and is not older than the model it was exported from."""
+    if not os.path.exists(tflite_path):
+        return False
+    if not os.path.exists(model_path):
+        return True
+    return os.path.getmtime(tflite_path) >= os.path.getmtime(model_path)
+
+
+def model_file_for(model_path, backend=FLOAT32):
+    """The file whose contents determine a backend's scores, e.g. for versioning cached results."""
+    return model_path if backend == FLOAT32 else tflite_path_for(model_path, backend)
+
+
+class SavedModelPredictor:
+    """
+    Runs an exported inference artifact through the same interface verify_sources uses.
+
+    Only the serving concrete function is restored, so no Keras model is rebuilt and
+    nothing needs to be traced on the first call.
+    """
+
+    def __init__(self, artifact_path):
+        import tensorflow as tf
+        self._module = tf.saved_model.load(artifact_path)
+        self._serve = self._module.signatures['serving_default']
+        _, kwargs = self._serve.structured_input_signature
+        (self._input_name, spec), = kwargs.items()
+        self.input_shape = tuple(spec.shape.as_list())
+
+    def predict_on_batch(self, batch):
+        outputs = self._serve(**{self._input_name: batch})
+        return next(iter(outputs.values())).numpy()
+
+
+def export_inference_artifact(model_path=DEFAULT_MODEL_PATH, artifact_path=None):
+    """
+    Exports a trained .h5 model as a SavedModel holding a single serving function.
+
+    The function has a fixed float32 input signature with a variable batch dimension,
+    so it is traced once here instead of at the first prediction after every start.
+
+    Returns:
+    str: The directory the artifact was written to.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    artifact_path = artifact_path or artifact_path_for(model_path)
+    model = load_model(model_path, compile=False)
+    _, height, width, channels = model.input_shape
+
+    module = tf.Module()
+    module.model = model
+    module.serve = tf.function(
+        lambda images: {'scores': model(images, training=False)},
+        input_signature=[tf.TensorSpec((None, height, width, channels), tf.float32, name='images')])
+    tf.saved_model.save(module, artifact_path, signatures={'serving_default': module.serve})
+    return artifact_path
+
+
+def load_inference_model(model_path=DEFAULT_MODEL_PATH, prefer_artifact=True, backend=FLOAT32):
+    """
+    Loads the model for a backend.
+
+    'float32' loads the exported artifact if it is current, otherwise the Keras model itself.
+    'float16' and 'int8' load the quantized TFLite model exported by quantize.py; an export
+    older than the model (e.g. after retraining or fine-tuning) is refused rather than
+    silently serving the previous model's scores.
+    """
+    if backend != FLOAT32:
+        if backend not in QUANTIZED_BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'")
+        tflite_path = tflite_path_for(model_path, backend)
+        if not os.path.exists(tflite_path):
+            raise FileNotFoundError(f"{tflite_path} not found; export it with 'python quantize.py export --backend {backend}'")
+        if not tflite_is_current(model_path, tflite_path):
+            raise RuntimeError(f"{tflite_path} is older than {model_path}; re-export it with "
+                               f"'python quantize.py export --backend {backend}'")
+        from quantize import TFLitePredictor
+        return TFLitePredictor(tflite_path)
+    artifact_path = artifact_path_for(model_path)
+    if prefer_artifact and artifact_is_current(model_path, artifact_path):
+        return SavedModelPredictor(artifact_path)
+    from tensorflow.keras.models import load_model
+    return load_model(model_path, compile=False)
+
+
+def warm_up(model, batch_size=1):
+    """Runs one prediction on a dummy batch so the first real request is not slowed by tracing."""
+    _, height, width, channels = model.input_shape
+    model.predict_on_batch(np.zeros((batch_size, height, width, channels), dtype=np.float32))
+
+
+class ModelLoader:
+    """
+    Loads the verification model on first use, from whichever thread asks first.
+
+    get() is safe to call concurrently; the model is loaded (and optionally warmed up)
+    exactly once. Calling preload() starts that work in the background, e.g. while the
+    GUI is waiting for the user to pick files.
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, warm=True, prefer_artifact=True, backend=FLOAT32):
+        self.model_path = model_path
+        self.warm = warm
+        self.prefer_artifact = prefer_artifact
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    model = load_inference_model(self.model_path, self.prefer_artifact, self.backend)
+                    if self.warm:
+                        warm_up(model)
+                    self._model = model
+                model = self._model
+        return model
+
+    def preload(self):
+        thread = threading.Thread(target=self.get, daemon=True)
+        thread.start()
+        return thread
+
+
+def benchmark_cold_start(model_path=DEFAULT_MODEL_PATH, prefer_artifact=True):
+    """
+    Measures the start-up cost of one loading strategy in seconds.
+
+    Only meaningful in a fresh process, since TensorFlow import and tracing are cached
+    for the life of the process; the CLI runs each strategy in its own subprocess.
+    """
+    timings = {}
+    started = time.perf_counter()
+    import tensorflow  # noqa: F401
+    timings['import_tensorflow'] = time.perf_counter() - started
+
+    mark = time.perf_counter()
+    model = load_inference_model(model_path, prefer_artifact)
+    timings['load'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    warm_up(model)
+    timings['first_prediction'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    warm_up(model)
+    timings['second_prediction'] = time.perf_counter() - mark
+
+    timings['time_to_first_verdict'] = time.perf_counter() - started
+    timings['backend'] = type(model).__name__
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and benchmark the verifier's inference model.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Export the .h5 model as a SavedModel artifact")
+    export_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    export_parser.add_argument('--output', help="Artifact directory (default: <model>_inference)")
+
+    bench_parser = subparsers.add_parser('benchmark', help="Report cold-start time for each loading strategy")
+    bench_parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    bench_parser.add_argument('--strategy', choices=['h5', 'artifact'], help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        print(f"Exported inference artifact to {export_inference_artifact(args.model, args.output)}")
+        return 0
+
+    if args.strategy:
+        # Child process: measure a single strategy and hand the result back as JSON
+        print(json.dumps(benchmark_cold_start(args.model, args.strategy == 'artifact')))
+        return 0
+
+    strategies = ['h5']
+    if artifact_is_current(args.model, artifact_path_for(args.model)):
+        strategies.append('artifact')
+    else:
+        print("No current inference artifact; run 'export' first to compare against it.")
+    for strategy in strategies:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'benchmark', '--model', args.model, '--strategy', strategy],
+            capture_output=True, text=True, check=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        print(f"{strategy:>8}: " + ", ".join(
+            f"{key}={value:.3f}s" if isinstance(value, float) else f"{key}={value}" for key, value in timings.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+import shared  # noqa: F401  Makes the Signature Trainer modules importable
+from dataset import scan_signatures
+from ingest import decode_file, Preprocessor
+from inference import THRESHOLD, model_input_size, verdict_for
+from model_loader import FLOAT32, FLOAT16, INT8, QUANTIZED_BACKENDS, load_inference_model, tflite_path_for
+
+CALIBRATION_SAMPLES = 200  # Images drawn from the Data directory to calibrate int8 ranges
+REPORT_SAMPLES = 500  # Images compared between backends in the report
+AGREEMENT_TOLERANCE = 0.01  # Largest fraction of verdicts allowed to differ from the float32 model
+
+
+def sample_images(data_directory, count, size, seed=0):
+    """
+    Draws up to `count` signatures at random from the Data directory, preprocessed exactly as for inference.
+
+    Args:
+    data_directory (str): The data directory, one sub-folder per person.
+    count (int): Number of images to draw.
+    size (tuple): (width, height) the model expects.
+    seed (int): Fixes which files are drawn.
+
+    Returns:
+    np.ndarray: float32 array of shape (N, height, width, 3) in [0, 1].
+    list: The file each row came from.
+    """
+    file_paths = [path for path, _, _ in scan_signatures(data_directory)]
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(file_paths))
+    width, height = size
+    preprocess = Preprocessor(width, height)
+    images = np.empty((min(count, len(file_paths)), height, width, 3), dtype=np.float32)
+    chosen = []
+    for i in order:
+        if len(chosen) == len(images):
+            break
+        img = decode_file(file_paths[i])
+        if img is None:
+            continue
+        preprocess(img, images[len(chosen)])
+        chosen.append(file_paths[i])
+    return images[:len(chosen)], chosen
+
+
+def export_quantized(model_path, backend, data_directory=None, calibration_samples=CALIBRATION_SAMPLES,
+                     output_path=None, seed=0):
+    """
+    Converts a trained .h5 model to a quantized TFLite model.
+
+    The model keeps float32 inputs and outputs, so it is a drop-in replacement for the
+    float model in verify_sources; quantization happens inside the graph.
+
+    Args:
+    model_path (str): The trained model, e.g. best_model.h5 or best_model_fold_N.h5.
+    backend (str): FLOAT16 or INT8.
+    data_directory (str): Data directory to draw calibration images from (required for INT8).
+    calibration_samples (int): Number of calibration images.
+    output_path (str): Defaults to tflite_path_for(model_path, backend).
+    seed (int): Fixes which calibration images are drawn.
+
+    Returns:
+    str: The path of the written .tflite file.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    if backend not in QUANTIZED_BACKENDS:
+        raise ValueError(f"backend must be one of {QUANTIZED_BACKENDS}")
+    model = load_model(model_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if backend == FLOAT16:
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        if not data_directory:
+            raise ValueError("int8 quantization needs a data directory for calibration")
+        calibration, _ = sample_images(data_directory, calibration_samples, model_input_size(model), seed)
+        if not len(calibration):
+            raise ValueError(f"No readable signatures found in {data_directory}")
+        converter.representative_dataset = lambda: ([image[np.newaxis]] for image in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    output_path = output_path or tflite_path_for(model_path, backend)
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+
+class TFLitePredictor:
+    """
+    Runs a TFLite model through the same interface verify_sources uses.
+
+    The interpreter's input is resized when the batch size changes, which reallocates
+    its tensors, so callers get the best throughput from a fixed batch size.
+    """
+
+    def __init__(self, tflite_path, num_threads=None):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=tflite_path, num_threads=num_threads or os.cpu_count())
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(int(d) for d in self._input['shape'][1:])
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()  # One interpreter cannot run two batches at once
+
+    def predict_on_batch(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self._interpreter.set_tensor(self._input['index'], batch)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output['index']).copy()
+
+
+def _time_predictions(model, images, batch_size):
+    """Returns (scores, milliseconds per image at batch size 1, images per second at `batch_size`)."""
+    model.predict_on_batch(images[:1])  # Warm up
+    started = time.perf_counter()
+    for image in images[:50]:
+        model.predict_on_batch(image[np.newaxis])
+    single_ms = (time.perf_counter() - started) / min(len(images), 50) * 1000.0
+
+    scores = []
+    started = time.perf_counter()
+    for start in range(0, len(images), batch_size):
+        scores.append(np.asarray(model.predict_on_batch(images[start:start + batch_size]))[:, 0])  # Genuine-class column, as in inference
+    throughput = len(images) / (time.perf_counter() - started)
+    return np.concatenate(scores), single_ms, throughput
+
+
+def compare_backends(model_path, data_directory, backends=QUANTIZED_BACKENDS, samples=REPORT_SAMPLES,
+                     batch_size=32, threshold=THRESHOLD, seed=1):
+    """
+    Scores the same Data sample with the float32 model and each exported quantized model.
+
+    Returns:
+    list: One dict per backend with 'backend', 'size_bytes', 'single_ms', 'images_per_second',
+          'max_score_diff' and 'verdict_agreement' (fraction of verdicts at `threshold`
+          matching the float32 model). Backends that have not been exported are skipped.
+    """
+    reference = load_inference_model(model_path)
+    images, _ = sample_images(data_directory, samples, model_input_size(reference), seed)
+    if not len(images):
+        raise ValueError(f"No readable signatures found in {data_directory}")
+    reference_scores, single_ms, throughput = _time_predictions(reference, images, batch_size)
+    reference_verdicts = [verdict_for(score, threshold) for score in reference_scores]
+    rows = [{
+        'backend': FLOAT32,
+        'size_bytes': os.path.getsize(model_path),
+        'single_ms': single_ms,
+        'images_per_second': throughput,
+        'max_score_diff': 0.0,
+        'verdict_agreement': 1.0,
+    }]
+    for backend in backends:
+        tflite_path = tflite_path_for(model_path, backend)
+        if not os.path.exists(tflite_path):
+            continue
+        scores, single_ms, throughput = _time_predictions(TFLitePredictor(tflite_path), images, batch_size)
+        agreement = np.mean([verdict_for(score, threshold) == verdict
+                             for score, verdict in zip(scores, reference_verdicts)])
+        rows.append({
+            'backend': backend,
+            'size_bytes': os.path.getsize(tflite_path),
+            'single_ms': single_ms,
+            'images_per_second': throughput,
+            'max_score_diff': float(np.max(np.abs(scores - reference_scores))),
+            'verdict_agreement': float(agreement),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export quantized verifier models and compare them with the float model.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Convert a .h5 model to a quantized TFLite model")
+    export_parser.add_argument('--model', default='best_model.h5')
+    export_parser.add_argument('--backend', choices=QUANTIZED_BACKENDS, default=INT8)
+    export_parser.add_argument('--data', help="Data directory with calibration images (required for int8)")
+    export_parser.add_argument('--samples', type=int, default=CALIBRATION_SAMPLES)
+    export_parser.add_argument('--output', help="Output file (default: <model>_<backend>.tflite)")
+
+    report_parser = subparsers.add_parser('report', help="Accuracy versus latency of each exported backend")
+    report_parser.add_argument('--model', default='best_model.h5')
+    report_parser.add_argument('--data', required=True, help="Data directory to draw test images from")
+    report_parser.add_argument('--samples', type=int, default=REPORT_SAMPLES)
+    report_parser.add_argument('--batch-size', type=int, default=32)
+    report_parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    report_parser.add_argument('--tolerance', type=float, default=AGREEMENT_TOLERANCE,
+                               help="Fail if more than this fraction of verdicts differ from float32")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        path = export_quantized(args.model, args.backend, args.data, args.samples, args.output)
+        print(f"Exported {args.backend} model to {path} ({os.path.getsize(path)} bytes)")
+        return 0
+
+    rows = compare_backends(args.model, args.data, samples=args.samples,
+                            batch_size=args.batch_size, threshold=args.threshold)
+    print(f"{'backend':<10}{'size KB':>10}{'ms/image':>10}{'images/s':>10}{'max diff':>10}{'agreement':>11}")
+    failed = False
+    for row in rows:
+        ok = 1.0 - row['verdict_agreement'] <= args.tolerance
+        failed = failed or not ok
+        print(f"{row['backend']:<10}{row['size_bytes'] / 1024:>10.0f}{row['single_ms']:>10.3f}"
+              f"{row['images_per_second']:>10.0f}{row['max_score_diff']:>10.4f}{row['verdict_agreement']:>10.1%}"
+              f"{'' if ok else ' !'}")
+    if len(rows) == 1:
+        print("No quantized models found; run 'export' first.")
+    if failed:
+        print(f"Verdicts at threshold {args.threshold} differ from float32 by more than {args.tolerance:.1%}",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+import os
+import sys
+import argparse
+import numpy as np
+import shared  # noqa: F401  Makes the Signature Trainer modules importable
+from dataset import scan_signatures
+from ingest import decode_image, Preprocessor
+from inference import DEFAULT_BATCH_SIZE, VerificationResult, collect_image_paths, model_input_size
+from result_cache import model_version
+
+DEFAULT_INDEX_PATH = 'reference_index.npz'
+DEFAULT_SIMILARITY_THRESHOLD = 0.9  # Used until the index is calibrated against forgeries
+TOP_K = 1  # References averaged per query; 1 is plain nearest-neighbour
+
+
+def embedding_model(model):
+    """
+    Wraps a trained classifier so it outputs its penultimate representation.
+
+    Dropout layers before the classification head are skipped, since they are the
+    identity at inference time.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.layers import Dropout
+
+    layers = model.layers[:-1]
+    while layers and isinstance(layers[-1], Dropout):
+        layers = layers[:-1]
+    if not layers:
+        raise ValueError("The model has no layer before its output to take embeddings from")
+    return tf.keras.Model(model.inputs, layers[-1].output)
+
+
+def embed_sources(embedder, sources, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Computes L2-normalised embeddings for images given as file paths or encoded bytes.
+
+    Returns:
+    np.ndarray: float32 array (N, D), one row per readable source.
+    np.ndarray: Boolean mask over `sources`, False for images that could not be decoded.
+    """
+    width, height = model_input_size(embedder)
+    batch = np.empty((min(batch_size, max(len(sources), 1)), height, width, 3), dtype=np.float32)
+    preprocess = Preprocessor(width, height)
+    readable = np.zeros(len(sources), dtype=bool)
+    chunks = []
+    for start in range(0, len(sources), batch_size):
+        filled = 0
+        for i in range(start, min(start + batch_size, len(sources))):
+            img = decode_image(sources[i])
+            if img is None:
+                continue
+            preprocess(img, batch[filled])
+            readable[i] = True
+            filled += 1
+        if filled:
+            chunks.append(np.asarray(embedder.predict_on_batch(batch[:filled]), dtype=np.float32).reshape(filled, -1))
+    if not chunks:
+        return np.empty((0, int(np.prod(embedder.output_shape[1:]))), dtype=np.float32), readable
+    embeddings = np.concatenate(chunks)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings, readable
+
+
+def best_threshold(genuine_scores, forged_scores):
+    """Returns the similarity threshold that best separates genuine from forged scores (balanced accuracy)."""
+    genuine_scores, forged_scores = np.sort(genuine_scores), np.sort(forged_scores)
+    candidates = np.unique(np.concatenate([genuine_scores, forged_scores]))
+    # Genuine accepted: score >= t; forged rejected: score < t
+    genuine_accepted = 1.0 - np.searchsorted(genuine_scores, candidates, side='left') / len(genuine_scores)
+    forged_rejected = np.searchsorted(forged_scores, candidates, side='left') / len(forged_scores)
+    return float(candidates[np.argmax(genuine_accepted + forged_rejected)])
+
+
+class ReferenceIndex:
+    """
+    Per-person index of genuine reference embeddings for writer-dependent verification.
+
+    A query is verified against the references of the person it claims to be: its score
+    is the mean cosine similarity to its TOP_K nearest references, computed for a whole
+    batch of queries as one matrix product. Each person's references are stored as one
+    contiguous block, so the lookup touches only that person's rows.
+
+    Enrolling a person only embeds their genuine signatures and adds the vectors; the
+    model is not retrained. The index records the version of the model it was built
+    with, since embeddings from another model are not comparable.
+    """
+
+    def __init__(self, model_version, embeddings=None, person_names=(), persons=None, paths=(),
+                 threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.model_version = model_version
+        self.threshold = threshold
+        self._blocks = {}  # person -> (K, D) float32 references
+        self._paths = {}  # person -> reference file names
+        if embeddings is not None and len(embeddings):
+            persons = np.asarray(persons)
+            paths = list(paths)
+            for person_id, name in enumerate(person_names):
+                rows = np.flatnonzero(persons == person_id)
+                self._blocks[name] = np.ascontiguousarray(embeddings[rows])
+                self._paths[name] = [paths[i] for i in rows]
+
+    def __len__(self):
+        return sum(len(block) for block in self._blocks.values())
+
+    def persons(self):
+        return sorted(self._blocks)
+
+    def references(self, person):
+        return self._blocks.get(person)
+
+    def enroll(self, person, embeddings, paths=()):
+        """Adds genuine reference embeddings (L2-normalised, e.g. from embed_sources) for a person."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(embeddings):
+            return  # Nothing readable; an empty block would break later joins and saves
+        block = self._blocks.get(person)
+        self._blocks[person] = embeddings if block is None else np.concatenate([block, embeddings])
+        self._paths[person] = self._paths.get(person, []) + list(paths or [''] * len(embeddings))
+
+    def remove(self, person):
+        self._blocks.pop(person, None)
+        self._paths.pop(person, None)
+
+    def scores(self, person, queries, top_k=TOP_K):
+        """
+        Similarity of each query embedding to the person's nearest references.
+
+        Returns:
+        np.ndarray: float32 scores in [-1, 1], one per query row.
+        """
+        references = self._blocks.get(person)
+        if references is None:
+            raise KeyError(f"'{person}' is not enrolled")
+        similarities = queries @ references.T  # (Q, K) cosine similarities
+        k = min(top_k, references.shape[0])
+        if k == 1:
+            return similarities.max(axis=1)
+        return np.partition(similarities, -k, axis=1)[:, -k:].mean(axis=1)
+
+    def leave_one_out_scores(self, person, top_k=TOP_K):
+        """Scores each of a person's references against the others, for calibration."""
+        references = self._blocks[person]
+        if len(references) < 2:
+            return np.empty(0, dtype=np.float32)
+        similarities = references @ references.T
+        np.fill_diagonal(similarities, -np.inf)
+        k = min(top_k, len(references) - 1)
+        return np.partition(similarities, -k, axis=1)[:, -k:].mean(axis=1)
+
+    def save(self, path):
+        names = self.persons()
+        blocks = [self._blocks[name] for name in names]
+        embeddings = np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+        persons = np.concatenate([np.full(len(b), i, dtype=np.int32) for i, b in enumerate(blocks)]) \
+            if blocks else np.empty(0, dtype=np.int32)
+        paths = [p for name in names for p in self._paths[name]]
+        temp_path = path + '.tmp.npz'
+        np.savez(temp_path, embeddings=embeddings, persons=persons, person_names=np.array(names, dtype=str),
+                 paths=np.array(paths, dtype=str), model_version=np.array(self.model_version),
+                 threshold=np.array(self.threshold))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data['model_version']), data['embeddings'], list(data['person_names']),
+                       data['persons'], list(data['paths']), float(data['threshold']))
+
+
+def person_for(file_path, directory_path):
+    """The person a signature belongs to: its top-level folder in the data directory."""
+    return os.path.relpath(file_path, directory_path).replace(os.sep, '/').split('/', 1)[0]
+
+
+def build_index(model_path, data_directory, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Builds a reference index from the data directory: one block per person of their genuine signatures.
+
+    Forgeries are embedded too, only to calibrate the similarity threshold, and are not stored.
+
+    Returns:
+    ReferenceIndex: The calibrated index.
+    dict: 'persons', 'references', 'forgeries' and 'threshold'.
+    """
+    from tensorflow.keras.models import load_model
+
+    embedder = embedding_model(load_model(model_path, compile=False))
+    scanned = scan_signatures(data_directory)
+    file_paths = [path for path, _, _ in scanned]
+    labels = np.array([label for _, label, _ in scanned], dtype=np.uint8)
+    embeddings, readable = embed_sources(embedder, file_paths, batch_size)
+    file_paths = [path for path, ok in zip(file_paths, readable) if ok]
+    labels = labels[readable]
+    persons = [person_for(path, data_directory) for path in file_paths]
+
+    index = ReferenceIndex(model_version(model_path))
+    for person in sorted(set(persons)):
+        rows = [i for i, p in enumerate(persons) if p == person and labels[i] == 0]
+        if rows:
+            index.enroll(person, embeddings[rows], [os.path.relpath(file_paths[i], data_directory) for i in rows])
+
+    genuine_scores, forged_scores = [], []
+    for person in index.persons():
+        genuine_scores.append(index.leave_one_out_scores(person))
+        forged_rows = [i for i, p in enumerate(persons) if p == person and labels[i] == 1]
+        if forged_rows:
+            forged_scores.append(index.scores(person, embeddings[forged_rows]))
+    genuine_scores = np.concatenate(genuine_scores) if genuine_scores else np.empty(0)
+    forged_scores = np.concatenate(forged_scores) if forged_scores else np.empty(0)
+    if len(genuine_scores) and len(forged_scores):
+        index.threshold = best_threshold(genuine_scores, forged_scores)
+    return index, {'persons': len(index.persons()), 'references': len(index),
+                   'forgeries': len(forged_scores), 'threshold': index.threshold}
+
+
+def verify_claims(embedder, index, person, sources, names=None, batch_size=DEFAULT_BATCH_SIZE, threshold=None):
+    """
+    Verifies images claimed to be signed by `person` against that person's references.
+
+    Returns:
+    list: A VerificationResult per source; score is the similarity to the nearest references.
+    """
+    names = sources if names is None else names
+    threshold = index.threshold if threshold is None else threshold
+    embeddings, readable = embed_sources(embedder, sources, batch_size)
+    scores = iter(index.scores(person, embeddings) if len(embeddings) else [])
+    results = []
+    for name, ok in zip(names, readable):
+        if not ok:
+            results.append(VerificationResult(name, None, "Unreadable"))
+            continue
+        score = float(next(scores))
+        results.append(VerificationResult(name, score, "Genuine" if score >= threshold else "Forged"))
+    return results
+
+
+def _load_checked(index_path, model_path):
+    index = ReferenceIndex.load(index_path)
+    if index.model_version != model_version(model_path):
+        raise SystemExit(f"{index_path} was built with a different model; rebuild it with 'build'")
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writer-dependent verification against per-person reference embeddings.")
+    parser.add_argument('--model', default='best_model.h5', help="Trained Keras model the embeddings come from")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Embed every genuine signature in the data directory")
+    build_parser.add_argument('data_directory', nargs='?', default='Data')
+
+    enroll_parser = subparsers.add_parser('enroll', help="Add a person's genuine signatures without retraining")
+    enroll_parser.add_argument('person')
+    enroll_parser.add_argument('inputs', nargs='+', help="Image files or directories of images")
+
+    verify_parser = subparsers.add_parser('verify', help="Verify signatures claimed to be by a person")
+    verify_parser.add_argument('person')
+    verify_parser.add_argument('inputs', nargs='+', help="Image files or directories of images")
+    verify_parser.add_argument('--threshold', type=float, help="Similarity threshold (default: the calibrated one)")
+
+    subparsers.add_parser('list', help="Show enrolled persons and their reference counts")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        index, stats = build_index(args.model, args.data_directory)
+        index.save(args.index)
+        print(f"Indexed {stats['references']} references for {stats['persons']} persons; "
+              f"threshold {stats['threshold']:.4f} (calibrated on {stats['forgeries']} forgeries)")
+        return 0
+
+    index = _load_checked(args.index, args.model)
+    if args.command == 'list':
+        for person in index.persons():
+            print(f"{person}\t{len(index.references(person))}")
+        return 0
+
+    from tensorflow.keras.models import load_model
+    embedder = embedding_model(load_model(args.model, compile=False))
+    file_paths = collect_image_paths(args.inputs)
+    if args.command == 'enroll':
+        embeddings, readable = embed_sources(embedder, file_paths)
+        if not len(embeddings):
+            print(f"No readable images for {args.person}; the index was not changed", file=sys.stderr)
+            return 1
+        index.enroll(args.person, embeddings, [p for p, ok in zip(file_paths, readable) if ok])
+        index.save(args.index)
+        print(f"Enrolled {len(embeddings)} references for {args.person} ({int((~readable).sum())} unreadable)")
+        return 0
+
+    if index.references(args.person) is None:
+        print(f"'{args.person}' is not enrolled", file=sys.stderr)
+        return 1
+    for result in verify_claims(embedder, index, args.person, file_paths, threshold=args.threshold):
+        score = "-" if result.score is None else f"{result.score:.4f}"
+        print(f"{result.filepath}\t{score}\t{result.verdict}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
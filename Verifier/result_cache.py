@@ -0,0 +1,169 @@
+import os
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+import shared  # noqa: F401  Makes the Signature Trainer modules importable
+from metrics import counter
+
+DEFAULT_CAPACITY = 10000  # Results kept in memory; the least recently used are evicted beyond this
+
+CACHE_HITS = counter('verifier_cache_hits_total', "Verifications answered from the result cache")
+CACHE_MISSES = counter('verifier_cache_misses_total', "Verifications that had to run the model")
+
+
+def model_version(model_path):
+    """Content hash of a model file; it changes whenever the model is retrained or replaced."""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def read_source(source):
+    """Returns the encoded bytes of a file path or in-memory image, or None if the file cannot be read."""
+    if isinstance(source, (str, os.PathLike)):
+        try:
+            with open(source, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    return source
+
+
+def image_key(data):
+    """Content address of an encoded image: a 128-bit BLAKE2b digest of its bytes."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of model scores for encoded signature images.
+
+    Entries are keyed by a hash of the image bytes, so the same scan resubmitted under
+    any name or path is recognised, and belong to one model version (see model_version).
+    Scores rather than verdicts are cached, so a different threshold still applies.
+
+    Lookups go to an in-memory LRU of `capacity` entries first, then to an optional SQLite
+    file at `disk_path` shared across restarts. Opening the file with a new model version
+    deletes the results of every other version, so a retrained best_model.h5 never
+    answers from stale scores.
+    """
+
+    def __init__(self, version, capacity=DEFAULT_CAPACITY, disk_path=None):
+        self.version = version
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._connection = None
+        if disk_path:
+            self._connection = sqlite3.connect(disk_path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " version TEXT NOT NULL, digest BLOB NOT NULL, score REAL NOT NULL,"
+                " PRIMARY KEY (version, digest)) WITHOUT ROWID")
+            with self._connection:
+                self._connection.execute("DELETE FROM results WHERE version != ?", (version,))
+
+    @classmethod
+    def for_model(cls, model_path, capacity=DEFAULT_CAPACITY, disk_path=None):
+        return cls(model_version(model_path), capacity, disk_path)
+
+    @property
+    def persistent(self):
+        """Whether lookups and writes may touch the SQLite file."""
+        return self._connection is not None
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _remember(self, key, score):
+        self._memory[key] = score
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, key, disk=True):
+        """
+        Returns the cached score for an image_key, or None.
+
+        With disk=False only the in-memory LRU is consulted and a miss is not counted,
+        so callers that must not block can check memory first and look on disk elsewhere.
+        """
+        with self._lock:
+            score = self._memory.get(key)
+            if score is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                CACHE_HITS.inc()
+                return score
+            if not disk:
+                return None
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT score FROM results WHERE version = ? AND digest = ?", (self.version, key)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    CACHE_HITS.inc()
+                    return row[0]
+            self.misses += 1
+        CACHE_MISSES.inc()
+        return None
+
+    def put(self, key, score):
+        self.put_many([(key, score)])
+
+    def put_many(self, items):
+        """Stores (image_key, score) pairs, writing them to disk in one transaction."""
+        with self._lock:
+            for key, score in items:
+                self._remember(key, score)
+            if self._connection is not None and items:
+                with self._connection:
+                    self._connection.executemany(
+                        "INSERT OR REPLACE INTO results (version, digest, score) VALUES (?, ?, ?)",
+                        [(self.version, key, score) for key, score in items])
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            'model_version': self.version,
+            'entries': len(self._memory),
+            'hits': hits,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+
+def benchmark(lookups=100000, distinct=1000, image_bytes=20000):
+    """Measures hit latency for in-memory lookups of `image_bytes`-sized images, including hashing."""
+    images = [os.urandom(image_bytes) for _ in range(distinct)]
+    cache = ResultCache('benchmark')
+    for image in images:
+        cache.put(image_key(image), 0.5)
+    started = time.perf_counter()
+    for i in range(lookups):
+        cache.get(image_key(images[i % distinct]))
+    elapsed = time.perf_counter() - started
+    return {'hit_us': elapsed / lookups * 1e6, 'hit_rate': cache.stats()['hit_rate']}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark result cache hits.")
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--image-bytes', type=int, default=20000)
+    args = parser.parse_args()
+    result = benchmark(args.lookups, image_bytes=args.image_bytes)
+    print(f"{result['hit_us']:.2f} us per hit (hash included), hit rate {result['hit_rate']:.2f}")
@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from inference import THRESHOLD, DEFAULT_BATCH_SIZE, VerificationResult, verdict_for, verify_sources
+from audit import audit_event, configure_audit_log
+from metrics import REGISTRY, histogram, instrument_from_env
+from model_loader import BACKENDS, FLOAT32, ModelLoader, model_file_for
+from result_cache import DEFAULT_CAPACITY, ResultCache, image_key
+
+MAX_BODY_SIZE = 10 * 1024 * 1024  # Largest image accepted per request, in bytes
+LATENCY_WINDOW = 1000  # Number of recent requests kept for latency percentiles
+
+REQUEST_SECONDS = histogram('verifier_request_seconds', "Time from receiving a /verify request to its verdict")
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent verification requests into batches for the model.
+
+    Requests are queued; a single consumer takes the first waiting request, then keeps
+    collecting until either `max_batch_size` requests are gathered or `max_wait_ms`
+    has passed, and runs the whole batch in one model call. The model always runs on
+    one dedicated thread so the event loop keeps accepting requests meanwhile.
+
+    With a ResultCache, an image already scored by this model is answered straight from
+    the cache, without queueing, decoding or a model call. A cache backed by SQLite is
+    read and written on its own thread, so no request waits on disk I/O in the event loop.
+    """
+
+    def __init__(self, model, max_batch_size=DEFAULT_BATCH_SIZE, max_wait_ms=5.0, threshold=THRESHOLD, cache=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.threshold = threshold
+        self.cache = cache
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.cache_executor = None
+        if cache is not None and cache.persistent:
+            self.cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+        self.task = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # Seconds, most recent requests
+        self.requests_served = 0
+        self.batches_run = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+        if self.cache_executor is not None:
+            self.cache_executor.shutdown(wait=True)  # Finishes pending result writes
+
+    async def submit(self, data):
+        """Queues encoded image bytes and waits for their VerificationResult."""
+        started = time.perf_counter()
+        key = None
+        if self.cache is not None:
+            key = image_key(data)
+            score = self.cache.get(key, disk=False)
+            if score is None and self.cache_executor is not None:
+                score = await asyncio.get_running_loop().run_in_executor(self.cache_executor, self.cache.get, key)
+            elif score is None:
+                score = self.cache.get(key)  # Counts the miss
+            if score is not None:
+                self.latencies.append(time.perf_counter() - started)
+                result = VerificationResult(None, score, verdict_for(score, self.threshold))
+                audit_event('verifier_verdict', source=None, score=score, verdict=result.verdict)
+                return result
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((data, key, future))
+        try:
+            return await future
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            sources = [data for data, _, _ in batch]
+            names = [None] * len(batch)
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, verify_sources, self.model, sources, names, len(batch), self.threshold)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches_run += 1
+            self.requests_served += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            scored = [(key, result.score) for (_, key, _), result in zip(batch, results)
+                      if key is not None and result.score is not None]
+            if self.cache_executor is not None:
+                loop.run_in_executor(self.cache_executor, self.cache.put_many, scored)  # Written after replying
+            elif scored:
+                self.cache.put_many(scored)
+
+    def stats(self):
+        latencies = np.array(self.latencies, dtype=np.float64) * 1000.0
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "requests_served": self.requests_served,
+            "batches_run": self.batches_run,
+            "mean_batch_size": self.requests_served / self.batches_run if self.batches_run else 0.0,
+            "latency_ms": {
+                "count": int(latencies.size),
+                "p50": float(np.percentile(latencies, 50)) if latencies.size else None,
+                "p95": float(np.percentile(latencies, 95)) if latencies.size else None,
+                "p99": float(np.percentile(latencies, 99)) if latencies.size else None,
+                "max": float(latencies.max()) if latencies.size else None,
+            },
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+class VerificationServer:
+    """
+    Minimal HTTP/1.1 front end for a MicroBatcher.
+
+    Endpoints:
+    POST /verify   body is the encoded image; returns score, verdict and latency_ms.
+    GET  /stats    queue depth, batch sizes, latency percentiles and cache hits.
+    GET  /metrics  all process metrics in the Prometheus text format.
+    GET  /health   liveness check.
+    """
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+
+    async def route(self, method, path, body):
+        if method == "POST" and path == "/verify":
+            if not body:
+                return 400, {"error": "Request body must contain the image"}
+            started = time.perf_counter()
+            result = await self.batcher.submit(body)
+            REQUEST_SECONDS.observe(time.perf_counter() - started)
+            if result.score is None:
+                return 400, {"error": "Could not decode image", "verdict": result.verdict}
+            return 200, {
+                "score": result.score,
+                "verdict": result.verdict,
+                "latency_ms": (time.perf_counter() - started) * 1000.0,
+            }
+        if method == "GET" and path == "/stats":
+            return 200, self.batcher.stats()
+        if method == "GET" and path == "/metrics":
+            return 200, REGISTRY.render_prometheus()
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    status, payload, keep_alive = 413, {"error": "Image too large"}, False
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        status, payload = await self.route(method, path.split('?', 1)[0], body)
+                    except Exception as e:
+                        status, payload = 500, {"error": str(e)}
+
+                if isinstance(payload, str):
+                    content, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    content, content_type = json.dumps(payload).encode(), "application/json"
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # Malformed request or client went away
+        finally:
+            writer.close()
+
+
+async def serve(model, host='127.0.0.1', port=8080, unix_path=None,
+                max_batch_size=DEFAULT_BATCH_SIZE, max_wait_ms=5.0, threshold=THRESHOLD, cache=None):
+    batcher = MicroBatcher(model, max_batch_size, max_wait_ms, threshold, cache)
+    await batcher.start()
+    server = VerificationServer(batcher)
+    if unix_path:
+        listener = await asyncio.start_unix_server(server.handle, path=unix_path)
+        print(f"Verification service listening on {unix_path}")
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        print(f"Verification service listening on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless signature verification service.")
+    parser.add_argument('--model', default='best_model.h5', help="Path to the trained model")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', dest='unix_path', help="Listen on a Unix socket instead of TCP")
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help="Longest a request waits for a batch to fill")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--audit-log', default='verifier_audit.log', help="JSON-lines file for verdict records ('' to disable)")
+    parser.add_argument('--backend', choices=BACKENDS, default=FLOAT32,
+                        help="Quantized backends must first be exported with quantize.py")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CAPACITY, help="Results kept in memory (0 disables the cache)")
+    parser.add_argument('--cache-db', help="SQLite file keeping results across restarts")
+    args = parser.parse_args(argv)
+
+    if args.audit_log:
+        configure_audit_log(args.audit_log)
+    instrument_from_env()
+
+    model = ModelLoader(args.model, backend=args.backend).get()  # Fails on a stale export before the cache is touched
+    cache = None
+    if args.cache_size > 0:
+        cache = ResultCache.for_model(model_file_for(args.model, args.backend), args.cache_size, args.cache_db)
+    try:
+        asyncio.run(serve(model, args.host, args.port, args.unix_path,
+                          args.max_batch_size, args.max_wait_ms, args.threshold, cache))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
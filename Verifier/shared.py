@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Modules shared with the trainer (audit logging, metrics, the dataset loader) live in
+# "Signature Trainer"; importing this module makes them importable from the Verifier.
+TRAINER_DIRECTORY = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Signature Trainer'))
+if TRAINER_DIRECTORY not in sys.path:
+    sys.path.append(TRAINER_DIRECTORY)